@@ -0,0 +1,36 @@
+# Generated by Django 5.2.2 on 2026-10-18 17:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_items(apps, schema_editor):
+    # Rows added concurrently by the old get-then-save path: keep the oldest, with the summed quantity
+    CartItem = apps.get_model('carts', 'CartItem')
+    duplicates = (
+        CartItem.objects.values('user_id', 'product_id')
+        .annotate(rows=Count('id'), keep=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        items = CartItem.objects.filter(user_id=group['user_id'], product_id=group['product_id'])
+        items.exclude(id=group['keep']).delete()
+        items.filter(id=group['keep']).update(quantity=group['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0002_initial'),
+        ('products', '0002_product_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_items, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(fields=('user', 'product'), name='unique_cart_item_per_user_product'),
+        ),
+    ]
@@ -8,5 +8,11 @@ class CartItem(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        constraints = [
+            # One row per product in a user's cart; adds increment its quantity (carts.services)
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_item_per_user_product'),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
\ No newline at end of file
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import CartItem
+from .services import CartError, add_item, cart_lines
 from products.serializers import ProductSerializer
 from products.models import Product
 
@@ -18,6 +19,9 @@ class CartItemSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'created_at', 'updated_at']
     
     def get_total_price(self, obj):
+        # Computed in SQL when the item was loaded through carts.services.cart_lines
+        if hasattr(obj, 'line_total'):
+            return obj.line_total
         if obj.product.discount_price:
             return obj.product.discount_price * obj.quantity
         return obj.product.price * obj.quantity
@@ -25,20 +29,30 @@ class CartItemSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         # Get the current user from the request
         user = self.context['request'].user
-        
-        # Check if the item already exists in the cart
+        product = validated_data['product']
+
+        # Atomic upsert: adds to the quantity if the product is already in the cart
         try:
-            cart_item = CartItem.objects.get(
-                user=user,
-                product=validated_data['product']
-            )
-            # Update quantity if item exists
-            cart_item.quantity += validated_data.get('quantity', 1)
-            cart_item.save()
-            return cart_item
-        except CartItem.DoesNotExist:
-            # Create new cart item
-            return CartItem.objects.create(
-                user=user,
-                **validated_data
-            )
\ No newline at end of file
+            add_item(user.id, product.id, validated_data.get('quantity', 1))
+        except CartError as e:
+            raise serializers.ValidationError({'quantity': str(e)})
+        return cart_lines(user.id).get(product=product)
+
+    def update(self, instance, validated_data):
+        instance = super().update(instance, validated_data)
+        # Reload for the SQL line total at the new quantity
+        return cart_lines(instance.user_id).get(pk=instance.pk)
+
+    def validate(self, attrs):
+        # Adds are checked against stock by the cart service; quantity edits are checked here
+        if self.instance is None:
+            return attrs
+        if attrs.get('product', self.instance.product) != self.instance.product:
+            # A line is one product; moving it could collide with another line for the new product
+            raise serializers.ValidationError({'product_id': 'The product of a cart item cannot be changed; add the new product instead.'})
+        quantity = attrs.get('quantity', self.instance.quantity)
+        if quantity < 1:
+            raise serializers.ValidationError({'quantity': 'Quantity must be at least 1.'})
+        if quantity > self.instance.product.stock:
+            raise serializers.ValidationError({'quantity': f'Only {self.instance.product.stock} in stock.'})
+        return attrs
\ No newline at end of file
@@ -0,0 +1,167 @@
+"""
+Cart reads and mutations shared by the REST API and the chatbot tools.
+
+``add_items`` adds any number of products in one transaction and a fixed
+number of queries: lock the product rows and read their stock, read the
+quantities already in the cart, validate, then one UPDATE incrementing the
+existing rows with ``F('quantity')`` and one bulk INSERT for the new ones.
+Concurrent adds of the same product queue on its row lock, and the
+``(user, product)`` unique constraint rejects a duplicate row outright.
+
+``cart_lines`` loads a cart with its products in one query, each line
+annotated with its total (``discount_price`` when set, else ``price``,
+times quantity) and every line with the cart's grand total through a
+window aggregate. ``cart_summary`` is a compact projection of the same
+query for the chatbot, cached per user together with a version (line
+count and latest ``updated_at`` of the lines and their products), so any
+worker can tell from one aggregate whether a cached summary is current.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, ExpressionWrapper, F, IntegerField, Max, Sum, Value, When, Window
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from products.models import Product
+
+from .models import CartItem
+
+
+# Entries are replaced as soon as the cart version moves; the TTL only bounds memory for idle carts
+SUMMARY_TTL = 60 * 60
+
+UNIT_PRICE = Coalesce("product__discount_price", "product__price")
+LINE_TOTAL = ExpressionWrapper(UNIT_PRICE * F("quantity"), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+class CartError(Exception):
+    """A cart change that cannot be made; the message is safe to show the user"""
+
+
+def merge_quantities(items):
+    """``{product_id: quantity}`` from ``(product_id, quantity)`` pairs, summing repeats"""
+    quantities = {}
+    for product_id, quantity in items:
+        if quantity < 1:
+            raise CartError(f"Quantity for product {product_id} must be at least 1.")
+        quantities[product_id] = quantities.get(product_id, 0) + quantity
+    return quantities
+
+
+def add_items(user_id, items):
+    """
+    Add ``(product_id, quantity)`` pairs to the user's cart, all or nothing.
+
+    Returns ``[{"product_id", "name", "quantity"}, ...]`` with each product's
+    new quantity in the cart. Raises CartError if a product does not exist,
+    is inactive, or the cart would hold more than its stock.
+    """
+    quantities = merge_quantities(items)
+    if not quantities:
+        raise CartError("No items to add.")
+
+    with transaction.atomic():
+        products = {
+            row["id"]: row
+            for row in Product.objects.select_for_update()
+            .filter(id__in=quantities, is_active=True)
+            .values("id", "name", "stock")
+        }
+        missing = [str(pk) for pk in quantities if pk not in products]
+        if missing:
+            raise CartError(f"Product {', '.join(missing)} is not available.")
+
+        in_cart = dict(
+            CartItem.objects.filter(user_id=user_id, product_id__in=quantities).values_list("product_id", "quantity")
+        )
+        short = [
+            f"{products[pk]['name']} (only {products[pk]['stock']} in stock)"
+            for pk, quantity in quantities.items()
+            if in_cart.get(pk, 0) + quantity > products[pk]["stock"]
+        ]
+        if short:
+            raise CartError(f"Not enough stock for {', '.join(short)}.")
+
+        now = timezone.now()
+        existing = [pk for pk in quantities if pk in in_cart]
+        if existing:
+            increment = Case(
+                *(When(product_id=pk, then=Value(quantities[pk])) for pk in existing),
+                output_field=IntegerField(),
+            )
+            CartItem.objects.filter(user_id=user_id, product_id__in=existing).update(
+                quantity=F("quantity") + increment, updated_at=now,
+            )
+        CartItem.objects.bulk_create([
+            CartItem(user_id=user_id, product_id=pk, quantity=quantity, created_at=now, updated_at=now)
+            for pk, quantity in quantities.items()
+            if pk not in in_cart
+        ])
+
+    return [
+        {"product_id": pk, "name": products[pk]["name"], "quantity": in_cart.get(pk, 0) + quantity}
+        for pk, quantity in quantities.items()
+    ]
+
+
+def add_item(user_id, product_id, quantity=1):
+    """Add one product; returns its new quantity in the cart"""
+    return add_items(user_id, [(product_id, quantity)])[0]["quantity"]
+
+
+def cart_lines(user_id):
+    """
+    The user's cart items with their products, oldest first, each annotated with
+    ``unit_price``, ``line_total`` and the cart-wide ``cart_total`` and ``cart_quantity``.
+    """
+    return (
+        CartItem.objects.filter(user_id=user_id)
+        .select_related("product__category")
+        .prefetch_related("product__additional_images")
+        .annotate(
+            unit_price=UNIT_PRICE,
+            line_total=LINE_TOTAL,
+            cart_total=Window(Sum(LINE_TOTAL)),
+            cart_quantity=Window(Sum("quantity")),
+        )
+        .order_by("created_at", "id")
+    )
+
+
+def cart_version(user_id):
+    """Changes whenever a line is added, removed or updated, or one of its products is saved"""
+    version = CartItem.objects.filter(user_id=user_id).aggregate(
+        lines=Count("id"), updated=Max("updated_at"), product_updated=Max("product__updated_at"),
+    )
+    return version["lines"], version["updated"], version["product_updated"]
+
+
+def cart_summary(user_id):
+    """
+    ``{"items": [{"product_id", "name", "price", "quantity", "line_total"}],
+    "quantity", "total"}`` with JSON-ready numbers, cached until the cart changes.
+    """
+    key = f"carts:summary:{user_id}"
+    version = cart_version(user_id)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    rows = list(
+        cart_lines(user_id).values("product_id", "product__name", "unit_price", "quantity", "line_total", "cart_total", "cart_quantity")
+    )
+    summary = {
+        "items": [
+            {
+                "product_id": row["product_id"],
+                "name": row["product__name"],
+                "price": float(row["unit_price"]),
+                "quantity": row["quantity"],
+                "line_total": float(row["line_total"]),
+            }
+            for row in rows
+        ],
+        "quantity": rows[0]["cart_quantity"] if rows else 0,
+        "total": float(rows[0]["cart_total"]) if rows else 0.0,
+    }
+    cache.set(key, (version, summary), SUMMARY_TTL)
+    return summary
@@ -1,5 +1,10 @@
-from django.urls import path
+from django.urls import path, include
+from rest_framework.routers import DefaultRouter
+from .views import CartItemViewSet
+
+router = DefaultRouter()
+router.register('items', CartItemViewSet, basename='cart-items')
 
 urlpatterns = [
-    # Cart app endpoints will be added here
+    path('', include(router.urls)),
 ]
@@ -1,3 +1,28 @@
-from django.shortcuts import render
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
 
-# Create your views here.
+from .serializers import CartItemSerializer
+from .services import cart_lines, cart_summary
+
+
+class CartItemViewSet(viewsets.ModelViewSet):
+    serializer_class = CartItemSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return cart_lines(self.request.user.id)
+
+    def list(self, request, *args, **kwargs):
+        # Every line carries the cart totals, so a page needs no second aggregate query
+        page = self.paginate_queryset(self.get_queryset())
+        response = self.get_paginated_response(self.get_serializer(page, many=True).data)
+        response.data['quantity'] = page[0].cart_quantity if page else 0
+        response.data['total'] = page[0].cart_total if page else 0
+        return response
+
+    @action(detail=False)
+    def summary(self, request):
+        """Compact cart lines and totals, the same projection the chatbot uses"""
+        return Response(cart_summary(request.user.id))
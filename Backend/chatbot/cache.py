@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU mapping with optional expiry.
+
+    Entries are evicted least-recently-used first once ``max_entries`` or
+    ``max_size`` (measured with ``sizeof``) is exceeded.  ``ttl`` is the
+    default lifetime in seconds; with ``sliding=True`` it is an idle timeout
+    that restarts on every read.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None, max_size=None, sizeof=None, sliding=False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_size = max_size
+        self.sizeof = sizeof or (lambda value: 1)
+        self.sliding = sliding
+        self.size = 0
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        self._data = OrderedDict()  # key -> [value, expires_at, size, ttl]
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            now = time.monotonic()
+            if entry[1] is not None and entry[1] <= now:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            if self.sliding and entry[3] is not None:
+                entry[1] = now + entry[3]
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def peek(self, key, default=None):
+        """Read an entry without touching recency, expiry or the hit counters"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                return default
+            return entry[0]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            size = self.sizeof(value)
+            expires_at = time.monotonic() + ttl if ttl is not None else None
+            self._data[key] = [value, expires_at, size, ttl]
+            self.size += size
+            self._enforce_limits()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            return self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and (entry[1] is None or entry[1] > time.monotonic())
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._data),
+            'size': self.size,
+            'max_entries': self.max_entries,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def _remove(self, key):
+        value, _, size, _ = self._data.pop(key)
+        self.size -= size
+        return value
+
+    def _enforce_limits(self):
+        now = time.monotonic()
+        # Least recently used entries sit at the front; drop expired ones first.
+        while self._data:
+            key, entry = next(iter(self._data.items()))
+            if entry[1] is None or entry[1] > now:
+                break
+            self._remove(key)
+            self.expirations += 1
+        # The most recently used entry is always kept, even if it alone is over budget.
+        while len(self._data) > 1 and (
+            len(self._data) > self.max_entries
+            or (self.max_size is not None and self.size > self.max_size)
+        ):
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
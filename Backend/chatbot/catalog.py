@@ -0,0 +1,218 @@
+"""
+Per-worker columnar snapshot of the product catalogue.
+
+Chatbot searches that only filter and sort (category, price, stock, flags)
+are answered from NumPy arrays instead of the ORM:
+
+- ``Columns`` holds one immutable set of arrays; readers take a reference
+  and never see a half-applied refresh.
+- The snapshot reloads rows with ``updated_at`` at or after its watermark,
+  at most every ``CATALOG_SNAPSHOT_MAX_STALENESS`` seconds, or at the next
+  query after a save or delete signal in this process bumped its version.
+- Writes that bypass ``save()`` (``QuerySet.update``, deletes in other
+  processes) are picked up by a full rebuild every
+  ``CATALOG_SNAPSHOT_REBUILD_INTERVAL`` seconds.
+"""
+import threading
+import time
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from products.models import Category, Product
+
+# Rows committed this long after their updated_at was set are still picked up by the next refresh
+COMMIT_LAG = timedelta(seconds=2)
+
+FIELDS = ("id", "name", "image", "price", "discount_price", "stock", "category_id", "is_active", "is_featured", "updated_at")
+
+
+class Columns:
+    """One immutable version of the catalogue as parallel arrays"""
+
+    def __init__(self, rows):
+        self.ids = np.array([r["id"] for r in rows], dtype=np.int64)
+        self.price = np.array([float(r["price"]) for r in rows], dtype=np.float64)
+        self.effective_price = np.array(
+            [float(r["discount_price"] if r["discount_price"] is not None else r["price"]) for r in rows], dtype=np.float64,
+        )
+        self.stock = np.array([r["stock"] for r in rows], dtype=np.int64)
+        self.category_id = np.array([r["category_id"] for r in rows], dtype=np.int64)
+        self.is_active = np.array([r["is_active"] for r in rows], dtype=bool)
+        self.is_featured = np.array([r["is_featured"] for r in rows], dtype=bool)
+        self.live = np.ones(len(rows), dtype=bool)
+        self.names = [r["name"] for r in rows]
+        self.images = [r["image"] for r in rows]
+        self.rows = {int(pk): i for i, pk in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def apply(self, rows, deleted):
+        """A new Columns with ``rows`` upserted and ``deleted`` ids dropped; self is left untouched"""
+        new = object.__new__(Columns)
+        added = [r for r in rows if r["id"] not in self.rows]
+        extra = Columns(added)
+        for name in ("ids", "price", "effective_price", "stock", "category_id", "is_active", "is_featured", "live"):
+            setattr(new, name, np.concatenate([getattr(self, name), getattr(extra, name)]))
+        new.names = self.names + extra.names
+        new.images = self.images + extra.images
+        # Only refreshes use the id map, under the snapshot lock, so it is shared rather than copied
+        new.rows = self.rows
+        new.rows.update({pk: len(self) + i for pk, i in extra.rows.items()})
+        for r in rows:
+            i = new.rows[r["id"]]
+            new.price[i] = float(r["price"])
+            new.effective_price[i] = float(r["discount_price"] if r["discount_price"] is not None else r["price"])
+            new.stock[i] = r["stock"]
+            new.category_id[i] = r["category_id"]
+            new.is_active[i] = r["is_active"]
+            new.is_featured[i] = r["is_featured"]
+            new.live[i] = True
+            new.names[i] = r["name"]
+            new.images[i] = r["image"]
+        for pk in deleted:
+            i = new.rows.pop(pk, None)
+            if i is not None:
+                new.live[i] = False
+        return new
+
+
+class CatalogSnapshot:
+    def __init__(self, max_staleness, rebuild_interval):
+        self.max_staleness = max_staleness
+        self.rebuild_interval = rebuild_interval
+        self.columns = None
+        self.categories = {}  # id -> lowercased name
+        self.watermark = None
+        self.version = 0
+        self.loaded_version = -1
+        self.checked_at = self.built_at = 0.0
+        self.deleted = set()
+        self.rebuilds = self.refreshes = self.queries = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self, deleted_id=None):
+        """Called from save/delete signals: the next query reloads the changed rows"""
+        with self._lock:
+            self.version += 1
+            if deleted_id is not None:
+                self.deleted.add(deleted_id)
+
+    def get_columns(self):
+        now = time.monotonic()
+        if (
+            self.columns is not None
+            and self.loaded_version == self.version
+            and now - self.checked_at < self.max_staleness
+        ):
+            return self.columns
+        with self._lock:
+            if self.columns is None or now - self.built_at >= self.rebuild_interval:
+                self._rebuild(now)
+            elif self.loaded_version != self.version or now - self.checked_at >= self.max_staleness:
+                self._refresh(now)
+            return self.columns
+
+    def _rebuild(self, now):
+        started = timezone.now() - COMMIT_LAG
+        self.columns = Columns(list(Product.objects.values(*FIELDS)))
+        self._load_categories()
+        self.watermark = started
+        self.deleted.clear()
+        self.loaded_version = self.version
+        self.built_at = self.checked_at = now
+        self.rebuilds += 1
+
+    def _refresh(self, now):
+        started = timezone.now() - COMMIT_LAG
+        version = self.version
+        rows = list(Product.objects.filter(updated_at__gte=self.watermark).values(*FIELDS))
+        deleted, self.deleted = self.deleted, set()
+        if rows or deleted:
+            self.columns = self.columns.apply(rows, deleted)
+        self._load_categories()
+        self.watermark = started
+        self.loaded_version = version
+        self.checked_at = now
+        self.refreshes += 1
+
+    def _load_categories(self):
+        self.categories = {pk: name.lower() for pk, name in Category.objects.values_list("id", "name")}
+
+    def query(self, category=None, price_limit=None, limit=10, offset=0):
+        """
+        ``(rows, has_more)`` for active products matching the filters, featured
+        and in-stock first, then cheapest, then by id: the same order as the
+        ORM search. Only the top ``offset + limit + 1`` rows are sorted.
+        """
+        columns = self.get_columns()
+        self.queries += 1
+        mask = columns.live & columns.is_active
+        if category:
+            needle = category.lower()
+            matching = [pk for pk, name in self.categories.items() if needle in name]
+            mask &= np.isin(columns.category_id, matching)
+        if price_limit is not None:
+            mask &= columns.effective_price <= price_limit
+        candidates = np.flatnonzero(mask)
+
+        # Featured and in-stock rank in whole blocks above any price
+        group = 3 - (2 * columns.is_featured[candidates] + (columns.stock[candidates] > 0))
+        key = group * 1e12 + columns.effective_price[candidates]
+        k = offset + limit + 1
+        if len(candidates) > k:
+            kth = np.partition(key, k - 1)[k - 1]
+            # Keep every row tied with the k-th so the id tie-break stays exact
+            keep = key <= kth
+            candidates, key = candidates[keep], key[keep]
+        order = np.lexsort((columns.ids[candidates], key))[:k]
+        top = candidates[order]
+
+        rows = [
+            {
+                "id": int(columns.ids[i]),
+                "name": columns.names[i],
+                "current_price": float(columns.effective_price[i]),
+                "image": columns.images[i],
+            }
+            for i in top[offset:offset + limit]
+        ]
+        return rows, len(top) > offset + limit
+
+    def stats(self):
+        columns = self.columns
+        return {
+            "rows": len(columns) if columns is not None else 0,
+            "live_rows": int(columns.live.sum()) if columns is not None else 0,
+            "version": self.version,
+            "rebuilds": self.rebuilds,
+            "refreshes": self.refreshes,
+            "queries": self.queries,
+        }
+
+
+catalog_snapshot = CatalogSnapshot(
+    max_staleness=settings.CHATBOT["CATALOG_SNAPSHOT_MAX_STALENESS"],
+    rebuild_interval=settings.CHATBOT["CATALOG_SNAPSHOT_REBUILD_INTERVAL"],
+)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+def product_saved(sender, instance, **kwargs):
+    catalog_snapshot.invalidate()
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    catalog_snapshot.invalidate(deleted_id=instance.pk)
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    catalog_snapshot.invalidate()
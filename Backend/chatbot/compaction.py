@@ -0,0 +1,149 @@
+"""
+Tool-result compaction for the chat history.
+
+Tool results are what bloats prompts: a page of products or an order with
+its items is re-sent with every later completion until the turn is folded
+into the summary. Two things keep them small:
+
+- ``compact_tool_result`` projects each tool's result to the fields the
+  model needs to answer, with row lists written as one column header plus
+  value rows and capped at ``TOOL_RESULT_MAX_ROWS``.
+- ``prune_tool_results`` replaces the payloads of turns older than the last
+  ``TOOL_RESULT_KEEP_TURNS`` with a stub once the assistant has replied to
+  them; the reply already carries what the user was told. Tool calls keep
+  their (stubbed) results so the prompt stays valid.
+
+Both return the prompt tokens they saved, and ``compaction_stats`` keeps
+per-turn totals for the chatbot stats endpoint.
+"""
+import json
+import threading
+from collections import deque
+
+from django.conf import settings
+
+from .context import estimate_tokens
+
+STALE_RESULT = "[Result omitted; the assistant reply after it has the details.]"
+
+
+def dumps(value):
+    return json.dumps(value, separators=(",", ":"), default=str)
+
+
+def table(rows, columns, max_rows):
+    """``rows`` (dicts) as ``{"columns", "rows", "omitted"?}`` keeping the first ``max_rows``"""
+    compact = {"columns": list(columns), "rows": [[row.get(c) for c in columns] for row in rows[:max_rows]]}
+    if len(rows) > max_rows:
+        compact["omitted"] = len(rows) - max_rows
+    return compact
+
+
+def without_none(value):
+    return {k: v for k, v in value.items() if v is not None}
+
+
+def project_search(result, max_rows):
+    return without_none({"products": table(result.get("products", []), ("id", "name", "price"), max_rows), "next": result.get("next")})
+
+
+def project_cart(result, max_rows):
+    return {
+        "items": table(result.get("items", []), ("product_id", "name", "quantity", "line_total"), max_rows),
+        "quantity": result.get("quantity"),
+        "total": result.get("total"),
+    }
+
+
+def project_order(result, max_rows):
+    fields = ("order_id", "order_number", "status", "tracking_number", "created_at", "shipped_at",
+              "delivered_at", "shipping_address", "total")
+    compact = without_none({field: result.get(field) for field in fields})
+    compact["items"] = table(result.get("items", []), ("product_id", "name", "quantity", "total"), max_rows)
+    return compact
+
+
+def project_add_to_cart(result, max_rows):
+    return {"success": result.get("success"), "message": result.get("message")}
+
+
+PROJECTIONS = {
+    "search_products": project_search,
+    "show_cart": project_cart,
+    "show_order_details": project_order,
+    "add_to_cart": project_add_to_cart,
+}
+
+
+def compact_tool_result(name, result):
+    """``(content, saved_tokens)``: the tool message content for ``result`` and the tokens it saves over plain JSON"""
+    raw = json.dumps(result, default=str)
+    projection = PROJECTIONS.get(name)
+    if isinstance(result, dict) and projection is not None:
+        content = dumps(projection(result, settings.CHATBOT["TOOL_RESULT_MAX_ROWS"]))
+    elif isinstance(result, str):
+        # Error messages from the registry are already short
+        content = result
+    else:
+        content = dumps(result)
+    return content, tokens(raw) - tokens(content)
+
+
+def prune_tool_results(history, keep_turns):
+    """
+    Stub out tool results of answered turns older than the last ``keep_turns``
+    answered ones. Stubbed messages are replaced in ``history`` with new dicts:
+    the message dicts are shared with the stored session state until it is saved.
+    Returns the prompt tokens saved.
+    """
+    answered = 0
+    saved = 0
+    # Walk back from the end; a turn counts as answered once an assistant reply without tool calls follows its results
+    replied = False
+    for index in range(len(history) - 1, -1, -1):
+        message = history[index]
+        if message["role"] == "assistant" and not message.get("tool_calls"):
+            replied = True
+        elif message["role"] == "user":
+            answered += replied
+            replied = False
+        elif message["role"] == "tool" and replied and answered >= keep_turns and message["content"] != STALE_RESULT:
+            saved += tokens(message["content"]) - tokens(STALE_RESULT)
+            history[index] = {**message, "content": STALE_RESULT}
+    return saved
+
+
+def tokens(content):
+    return estimate_tokens({"content": content})
+
+
+class CompactionStats:
+    """Prompt tokens saved by compaction, per turn, for this worker"""
+
+    def __init__(self, recent=100):
+        self.turns = 0
+        self.results = 0
+        self.saved_tokens = 0
+        self.recent = deque(maxlen=recent)
+        self._lock = threading.Lock()
+
+    def record_turn(self, saved_tokens, results):
+        with self._lock:
+            self.turns += 1
+            self.results += results
+            self.saved_tokens += saved_tokens
+            self.recent.append(saved_tokens)
+
+    def stats(self):
+        with self._lock:
+            recent = list(self.recent)
+            return {
+                "turns": self.turns,
+                "tool_results": self.results,
+                "saved_tokens": self.saved_tokens,
+                "saved_tokens_per_turn": self.saved_tokens / self.turns if self.turns else 0.0,
+                "recent_turns": recent[-10:],
+            }
+
+
+compaction_stats = CompactionStats()
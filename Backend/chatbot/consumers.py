@@ -1,18 +1,33 @@
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+import asyncio
 import json
-from decouple import config
-from .models import ChatbotSession, ChatMessage
-from .ecommerce_tools import search_products, add_to_cart, show_cart, show_order_details, tools
-from openai import OpenAI
+import uuid
+import weakref
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from .models import ChatbotSession
+from .serializers import ChatMessageSerializer
+from .ecommerce_tools import registry, tools
+from .llm import acomplete_message
+from .history import history_from_messages, encode_cursor, decode_cursor
+from .context import build_context, fold_history, split_turns, summarize
+from .compaction import compact_tool_result, compaction_stats, prune_tool_results
+from .session_state import session_state, ConflictError
+from .scheduler import llm_scheduler, SchedulerBusy
+from .persistence import message_buffer
 
-endpoint = "https://models.github.ai/inference"
-model_name = "openai/gpt-4.1"
-token = config("GITHUB_TOKEN")
-client = OpenAI(base_url=endpoint, api_key=token)
 
+# One lock per session on this worker, so connections sharing a session take turns
+_session_locks = weakref.WeakValueDictionary()
 
-session_history = {}
+
+def session_lock(session_id):
+    lock = _session_locks.get(session_id)
+    if lock is None:
+        lock = _session_locks[session_id] = asyncio.Lock()
+    return lock
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -21,103 +36,334 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.user_id = self.scope.get('user_id')
         try:
             self.session = await self.get_session(self.session_id, self.user_id)
-            if self.session_id not in session_history:
-                # Add system prompt as the first message
-                session_history[self.session_id] = [
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an e-commerce assistant chatbot. "
-                            "You can help users search for products, add items to their cart, "
-                            "show cart details, and provide order information. "
-                            "Always be helpful and concise."
-                        ),
-                    }
-                ]
-                messages = await self.get_session_messages(self.session_id)
-                session_history[self.session_id] = [{"role": "user" if m["message_type"] == "user" else "system", "content": m["content"]} for m in messages]
+            self.history, self.state_version = await self.load_state()
+            # Turns are queued and run by a single worker task, so frames such as
+            # "stop" are still read while a reply is being generated
+            self.turns = asyncio.Queue()
+            self.current_turn = None
+            self.partial_reply = []
+            self.closed = False
+            self.turn_worker = asyncio.create_task(self.process_turns())
             await self.accept()
         except ChatbotSession.DoesNotExist:
             await self.close()
 
+    async def disconnect(self, close_code):
+        self.closed = True
+        if hasattr(self, 'turn_worker'):
+            # Nobody is left to read the reply; stop paying for it
+            self.turn_worker.cancel()
+            await asyncio.wait([self.turn_worker])
+        await message_buffer.flush()
+
+    async def load_state(self):
+        """
+        Return the session's LLM message list and its state version, rebuilding
+        the list from stored messages if the state backend has nothing for it.
+        """
+        state = await session_state.load(self.session_id)
+        if state is not None:
+            return state
+        # Buffered messages must reach the database before it is read back
+        await message_buffer.flush()
+        summary, messages, skipped = await self.get_session_messages(self.session_id)
+        if skipped:
+            summary = await self.fold_skipped_messages(summary, messages[0] if messages else None)
+        return history_from_messages(messages, summary), 0
+
+    async def fold_skipped_messages(self, summary, first_kept):
+        """
+        Fold the stored messages between the summary and ``first_kept`` (the oldest
+        one hydrated) into the summary, a page per completion, so the live history
+        starts right after the summary boundary again. Returns the new summary.
+        """
+        before = (first_kept['timestamp'], first_kept['id']) if first_kept else None
+        page_size = max(settings.CHATBOT['HISTORY_HYDRATE_LIMIT'], 1)
+        failed = False
+        while True:
+            page = await self.get_skipped_messages(self.session_id, before, page_size)
+            if not page:
+                return summary
+            if not failed:
+                try:
+                    summary = await summarize(summary, history_from_messages(page)[1:], settings.CHATBOT['SUMMARY_MAX_TOKENS'])
+                except Exception as e:
+                    # Leave the rest out of the summary rather than out of step with the live history
+                    print(f"Error summarizing session {self.session_id}: {e}")
+                    failed = True
+            await self.save_summary(self.session, summary, through=(page[-1]['timestamp'], page[-1]['id']))
+
+    async def save_state(self):
+        """Save the history; if another worker saved first, replay this turn on top of its state"""
+        turn = split_turns(self.history)[-1]
+        for _ in range(settings.CHATBOT['SESSION_STATE_RETRIES']):
+            try:
+                self.state_version = await session_state.save(self.session_id, self.history, self.state_version)
+                return
+            except ConflictError:
+                self.history, self.state_version = await self.load_state()
+                self.history.extend(turn)
+        print(f"Could not save state of session {self.session_id}: too many concurrent updates")
+
     async def receive(self, text_data):
         if self.user_id and hasattr(self, 'session'):
             data = json.loads(text_data)
+            if data.get('type') == 'history':
+                await self.send_history_page(data.get('before'), data.get('limit'))
+                return
+            if data.get('type') == 'stop':
+                await self.cancel_turns()
+                return
             is_bot = data.get('isBot', False)
             message = data.get('message')
+            stream = data.get('stream', settings.CHATBOT['STREAM_REPLIES'])
             if not is_bot and message:
-                session_history[self.session_id].append({"role": "user", "content": message})
+                if data.get('supersede', settings.CHATBOT['CANCEL_SUPERSEDED_TURNS']):
+                    await self.cancel_turns()
+                self.turns.put_nowait((message, stream))
+
+    async def cancel_turns(self):
+        """Cancel the turn being generated and drop the ones still queued behind it"""
+        while not self.turns.empty():
+            message, _ = self.turns.get_nowait()
+            await self.send_cancelled(message)
+        if self.current_turn is not None:
+            self.current_turn.cancel()
+
+    async def process_turns(self):
+        """Run this connection's turns one after another, in the order they arrived"""
+        while True:
+            message, stream = await self.turns.get()
+            self.current_turn = asyncio.create_task(self.handle_turn(message, stream))
+            try:
+                # wait() rather than await, so cancelling the turn does not stop the worker
+                await asyncio.wait([self.current_turn])
+            except asyncio.CancelledError:
+                self.current_turn.cancel()
+                await asyncio.wait([self.current_turn])
+                raise
+            finally:
+                self.current_turn = None
+
+    async def handle_turn(self, message, stream):
+        try:
+            async with session_lock(self.session_id):
+                async with llm_scheduler.slot(self.user_id):
+                    await self.run_turn(message, stream)
+        except SchedulerBusy as e:
+            # The message was not processed; the client may retry it later
+            await self.send(text_data=json.dumps({"type": "busy", "reason": e.reason, "retryAfter": e.retry_after, "message": message}))
+        except asyncio.CancelledError:
+            # Cancelled before the reply was started: nothing is recorded for the turn
+            await self.send_cancelled(message)
+        except Exception as e:
+            print(f"Error in turn for session {self.session_id}: {e}")
+
+    async def run_turn(self, message, stream):
+        self.history, self.state_version = await self.load_state()
+        # Earlier turns' tool payloads are stale once answered; later prompts only need the replies
+        self.saved_tokens = prune_tool_results(self.history, settings.CHATBOT['TOOL_RESULT_KEEP_TURNS'])
+        self.tool_results = 0
+        self.history.append({"role": "user", "content": message})
+        await self.send_to_chat(message)
+        self.partial_reply = []
+        try:
+            if stream:
+                bot_response = await self.stream_response()
+            else:
                 try:
                     bot_response = await self.get_response()
                 except Exception as e:
                     bot_response = "Sorry, there was an error processing your request."
                     print(f"OpenAI error: {e}")
-                await self.send_to_chat(message)
-                session_history[self.session_id].append({"role": "system", "content": bot_response})
                 await self.send_to_chat(bot_response, isBot=True)
-                await self.save_message(self.session, message, isBot=False)
-                await self.save_message(self.session, bot_response, isBot=True)
+        except asyncio.CancelledError:
+            await self.record_cancelled_turn(message)
+            return
+        self.history.append({"role": "assistant", "content": bot_response})
+        compaction_stats.record_turn(self.saved_tokens, self.tool_results)
+        await self.save_state()
+        self.save_message(self.session, message, isBot=False)
+        self.save_message(self.session, bot_response, isBot=True)
+
+    async def record_cancelled_turn(self, message):
+        """
+        Keep the user message and whatever reply text was already sent, so the
+        model sees the superseded question next turn. Unanswered tool calls are
+        dropped, since a prompt must pair every tool call with its result.
+        """
+        reply = "".join(self.partial_reply)
+        last_user = max(i for i, m in enumerate(self.history) if m["role"] == "user")
+        del self.history[last_user + 1:]
+        if reply:
+            self.history.append({"role": "assistant", "content": reply})
+        await self.save_state()
+        self.save_message(self.session, message, isBot=False)
+        if reply:
+            self.save_message(self.session, reply, isBot=True)
+        await self.send_cancelled(message, reply)
+
+    async def send_cancelled(self, message, reply=""):
+        """Tell the client a message will get no (further) reply; skipped once the socket is gone"""
+        if not self.closed:
+            await self.send(text_data=json.dumps({"type": "cancelled", "message": message, "reply": reply, "isBot": True}))
+
+    async def stream_response(self):
+        """
+        Stream the bot reply as start / delta / end frames sharing one message id.
+        The end frame carries the full text, which is authoritative if the stream failed midway.
+        """
+        message_id = uuid.uuid4().hex
+        await self.send(text_data=json.dumps({"type": "start", "id": message_id, "isBot": True}))
 
-    async def get_response(self):
+        async def send_delta(text):
+            self.partial_reply.append(text)
+            await self.send(text_data=json.dumps({"type": "delta", "id": message_id, "delta": text}))
+
+        bot_response = await self.get_response(on_delta=send_delta)
+        await self.send(text_data=json.dumps({"type": "end", "id": message_id, "message": bot_response, "isBot": True}))
+        return bot_response
+
+    async def get_response(self, on_delta=None):
+        """
+        Get the bot reply for the current session history.
+        When ``on_delta`` is given, completion text is streamed through it as it arrives.
+
+        Every tool call the model makes in one completion runs concurrently and
+        all results go back in a single follow-up, for up to MAX_TOOL_ROUNDS rounds.
+        """
         try:
-            response = client.chat.completions.create(
-                messages=session_history.get(self.session_id, []),
-                tools=tools,
-                tool_choice="auto",
+            for _ in range(settings.CHATBOT['MAX_TOOL_ROUNDS']):
+                message = await acomplete_message(
+                    await self.build_prompt(),
+                    on_delta=on_delta,
+                    tools=tools,
+                    tool_choice="auto",
+                    temperature=1.0,
+                    top_p=1.0,
+                )
+                # No tool call, just return the model's message
+                if not message.tool_calls:
+                    return message.content
+                self.history.append(message.model_dump(include={"role", "content", "tool_calls"}, exclude_none=True))
+                results = await asyncio.gather(*(registry.run(tool_call, self.user_id) for tool_call in message.tool_calls))
+                for tool_call, tool_result in zip(message.tool_calls, results):
+                    content, saved = compact_tool_result(tool_call.function.name, tool_result)
+                    self.saved_tokens += saved
+                    self.tool_results += 1
+                    self.history.append({"role": "tool", "tool_call_id": tool_call.id, "content": content})
+            # Out of tool rounds: ask the model to answer with what it has
+            followup = await acomplete_message(
+                await self.build_prompt(),
+                on_delta=on_delta,
                 temperature=1.0,
                 top_p=1.0,
-                model=model_name,
             )
-            choice = response.choices[0]
-            # Handle function call if present
-            if hasattr(choice.message, "tool_calls") and choice.message.tool_calls:
-                for tool_call in choice.message.tool_calls:
-                    tool_name = tool_call.function.name
-                    params = json.loads(tool_call.function.arguments)
-                    try:
-                        if tool_name == "search_products":
-                            tool_result = await search_products(params)
-                        elif tool_name == "add_to_cart":
-                            tool_result = await add_to_cart(params)
-                        elif tool_name == "show_cart":
-                            tool_result = await show_cart(params)
-                        elif tool_name == "show_order_details":
-                            tool_result = await show_order_details(params)
-                        else:
-                            tool_result = "Unknown tool requested."
-                    except Exception as e:
-                        tool_result = f"Error running tool: {str(e)}"
-                    # Add tool result to history and get final AI response
-                    session_history[self.session_id].append({"role": "function", "name": tool_name, "content": json.dumps(tool_result)})
-                    # Ask the model to summarize or respond with the tool result
-                    followup = client.chat.completions.create(
-                        messages=session_history.get(self.session_id, []),
-                        temperature=1.0,
-                        top_p=1.0,
-                        model=model_name,
-                    )
-                    return followup.choices[0].message.content
-            # No tool call, just return the model's message
-            return choice.message.content
+            return followup.content
         except Exception as e:
             print(f"Error in get_response: {e}")
             return "Sorry, I couldn't process your request."
 
+    async def build_prompt(self):
+        """
+        Prompt for the next completion: the system prompt, the running summary and
+        the most recent turns that fit in the token budget. Older turns are folded
+        into the summary, which is persisted on the session.
+        """
+        budget = settings.CHATBOT['CONTEXT_TOKEN_BUDGET']
+        try:
+            folded = await fold_history(self.history, budget, settings.CHATBOT['SUMMARY_MAX_TOKENS'])
+        except Exception as e:
+            # Older turns simply fall out of the prompt until summarizing succeeds
+            print(f"Error summarizing session {self.session_id}: {e}")
+        else:
+            if folded:
+                summary, messages = folded
+                # Only user messages and final bot replies are stored as ChatMessage rows
+                stored = sum(1 for m in messages if m["role"] == "user" or (m["role"] == "assistant" and not m.get("tool_calls")))
+                # Earlier turns may still be buffered; the new boundary is counted over stored rows
+                await message_buffer.flush()
+                await self.save_summary(self.session, summary, folded=stored)
+        return build_context(self.history, budget)
+
+    async def send_history_page(self, cursor, limit):
+        """
+        Answer {"type": "history", "before": cursor} with the next page of older stored messages.
+        Omit ``before`` for the newest page; ``next`` is null once the start of the session is reached.
+        """
+        try:
+            limit = int(limit or settings.CHATBOT['HISTORY_PAGE_SIZE'])
+        except (TypeError, ValueError):
+            await self.send(text_data=json.dumps({"type": "history", "error": "Invalid limit"}))
+            return
+        limit = max(1, min(limit, settings.CHATBOT['HISTORY_PAGE_SIZE']))
+        await message_buffer.flush()
+        try:
+            messages, next_cursor = await self.get_message_page(self.session, cursor, limit)
+        except ValueError:
+            await self.send(text_data=json.dumps({"type": "history", "error": "Invalid cursor"}))
+            return
+        await self.send(text_data=json.dumps({"type": "history", "messages": messages, "next": next_cursor}))
+
     async def send_to_chat(self, message, isBot=False):
         await self.send(text_data=json.dumps({"message": message, "isBot": isBot}))
 
-    @database_sync_to_async
     def save_message(self, session, message, isBot):
-        ChatMessage.objects.create(message_type='bot' if isBot else 'user', content=message, session=session)
+        """Queue the message on the worker's write-behind buffer"""
+        message_buffer.add(session, 'bot' if isBot else 'user', message)
 
     @database_sync_to_async
     def get_session(self, session_id, user_id):
         return ChatbotSession.objects.get(session_id=session_id, user_id=user_id)
 
+    @database_sync_to_async
+    def save_summary(self, session, summary, folded=0, through=None):
+        """
+        Save the summary and move its boundary to ``through`` (a stored message's
+        timestamp and id), or else past the next ``folded`` stored messages.
+        """
+        with transaction.atomic():
+            session = ChatbotSession.objects.select_for_update().get(pk=session.pk)
+            if through is None and folded:
+                rows = list(session.unsummarized_messages().values_list('timestamp', 'id')[:folded])
+                through = rows[-1] if rows else None
+            update = {'summary': summary}
+            if through is not None:
+                update['summarized_until'], update['summarized_until_id'] = through
+            ChatbotSession.objects.filter(pk=session.pk).update(**update)
+
     @database_sync_to_async
     def get_session_messages(self, session_id):
+        """
+        Return the session summary, the latest stored messages after its boundary (at
+        most HISTORY_HYDRATE_LIMIT of them) and whether older ones were left out.
+        """
         try:
             session = ChatbotSession.objects.get(session_id=session_id)
-            return list(session.messages.values('message_type', 'content', 'timestamp'))
         except ChatbotSession.DoesNotExist:
-            return []
+            return "", [], False
+        limit = settings.CHATBOT['HISTORY_HYDRATE_LIMIT']
+        messages = list(
+            session.unsummarized_messages().reverse().values('id', 'message_type', 'content', 'timestamp')[:limit + 1]
+        )
+        return session.summary, list(reversed(messages[:limit])), len(messages) > limit
+
+    @database_sync_to_async
+    def get_skipped_messages(self, session_id, before, limit):
+        """The oldest stored messages after the summary boundary and before ``before`` (timestamp, id)"""
+        messages = ChatbotSession.objects.get(session_id=session_id).unsummarized_messages()
+        if before is not None:
+            timestamp, pk = before
+            messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+        return list(messages.values('id', 'message_type', 'content', 'timestamp')[:limit])
+
+    @database_sync_to_async
+    def get_message_page(self, session, cursor, limit):
+        """Stored messages older than ``cursor``, newest first, and the cursor for the page after"""
+        messages = session.messages.order_by('-timestamp', '-id')
+        if cursor:
+            timestamp, pk = decode_cursor(cursor)
+            messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+        page = list(messages[:limit + 1])
+        next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return ChatMessageSerializer(page[:limit], many=True).data, next_cursor
@@ -0,0 +1,117 @@
+"""
+Token-budgeted prompt construction with a rolling conversation summary.
+
+Session history is laid out as ``[system prompt, summary?, *turns]`` where a
+turn starts at a user message and runs up to the next one (assistant replies,
+tool calls and tool results included).  Turns are only ever kept or folded
+whole, so tool calls never lose their results.
+"""
+import json
+
+from .llm import acomplete
+
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+# Rough tokens-per-character ratio for English text; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(message):
+    """Approximate prompt tokens for a single message"""
+    text = message.get("content") or ""
+    for call in message.get("tool_calls") or []:
+        text += call["function"]["name"] + call["function"]["arguments"]
+    return len(text) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+
+
+def count_tokens(messages):
+    return sum(estimate_tokens(m) for m in messages)
+
+
+def summary_message(summary):
+    return {"role": "system", "content": SUMMARY_PREFIX + summary}
+
+
+def history_head(history):
+    """Number of leading messages (system prompt and summary) that are always sent"""
+    return 2 if len(history) > 1 and history[1]["role"] == "system" else 1
+
+
+def split_turns(messages):
+    turns = []
+    for message in messages:
+        if message["role"] == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def recent_turns(history, budget):
+    """
+    Return how many trailing history messages fit in ``budget`` tokens alongside the head.
+    The latest turn is always included, even when it alone exceeds the budget.
+    """
+    head = history_head(history)
+    remaining = budget - count_tokens(history[:head])
+    kept = 0
+    for index, turn in enumerate(reversed(split_turns(history[head:]))):
+        cost = count_tokens(turn)
+        if index and cost > remaining:
+            break
+        remaining -= cost
+        kept += len(turn)
+    return kept
+
+
+def build_context(history, budget):
+    """Prompt messages for the next completion: head plus the most recent turns that fit"""
+    head = history_head(history)
+    kept = recent_turns(history, budget)
+    return history[:head] + history[len(history) - kept:]
+
+
+def current_summary(history):
+    return history[1]["content"][len(SUMMARY_PREFIX):] if history_head(history) == 2 else ""
+
+
+async def fold_history(history, budget, max_summary_tokens):
+    """
+    Fold the oldest turns into the running summary once the history outgrows ``budget``.
+
+    Folds down to half the budget so the summary is refreshed once every few
+    turns rather than on every turn.  Mutates ``history`` in place and returns
+    ``(summary, folded_messages)``, or ``None`` when everything still fits.
+    """
+    head = history_head(history)
+    if recent_turns(history, budget) == len(history) - head:
+        return None
+    end = len(history) - recent_turns(history, budget // 2)
+    folded = history[head:end]
+    summary = await summarize(current_summary(history), folded, max_summary_tokens)
+    history[1:end] = [summary_message(summary)]
+    return summary, folded
+
+
+async def summarize(summary, messages, max_tokens):
+    """Fold ``messages`` into the running ``summary`` with one cheap completion"""
+    transcript = "\n".join(
+        f"{m['role']}: {m.get('content') or json.dumps([c['function'] for c in m.get('tool_calls') or []])}"
+        for m in messages
+    )
+    response = await acomplete(
+        [
+            {
+                "role": "system",
+                "content": (
+                    "You maintain a running summary of a shopping assistant conversation. "
+                    "Keep product names, ids, prices, cart and order facts and user preferences. "
+                    "Reply with the updated summary only."
+                ),
+            },
+            {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+        ],
+        temperature=0.2,
+        max_tokens=max_tokens,
+    )
+    return response.choices[0].message.content.strip()
@@ -1,76 +1,338 @@
+import asyncio
+import base64
+import binascii
+import json
+import math
+
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from jsonschema import Draft7Validator
 
+from carts import services as cart_services
+from carts.services import CartError
+from orders import services as order_services
+from orders.models import Order
+from products import search as product_search
+from products.models import Category, Product
 
-@database_sync_to_async
-def search_products(params):
-    # Replace with real product search logic
-    return [
-        {"id": 1, "name": "Phone X", "price": 999, "category": "phone"},
-        {"id": 2, "name": "Laptop Y", "price": 1299, "category": "laptop"},
-    ]
+from .cache import LRUCache
+from .catalog import catalog_snapshot
+from . import semantic
 
 
-@database_sync_to_async
-def add_to_cart(params):
-    # Replace with real add-to-cart logic
-    return {"success": True, "message": f"Added product {params.get('product_id')} to cart."}
+def tool_to_async(func):
+    """
+    Run a tool in the shared thread pool instead of the single thread-sensitive
+    thread, so several tool calls from one completion query the DB concurrently.
+    """
+    return database_sync_to_async(func, thread_sensitive=False)
 
 
-@database_sync_to_async
-def show_cart(params):
-    # Replace with real cart retrieval logic
-    return {
-        "cart": [
-            {"id": 1, "name": "Phone X", "price": 999, "quantity": 1},
-            {"id": 2, "name": "Laptop Y", "price": 1299, "quantity": 2},
-        ]
-    }
+class ToolError(Exception):
+    """A tool call that could not be run; the message is shown to the model"""
+
+
+class Tool:
+    def __init__(self, name, description, parameters, handler, timeout=None, cache_ttl=None):
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.handler = handler
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        Draft7Validator.check_schema(parameters)
+        self.validator = Draft7Validator(parameters)
+
+    @property
+    def schema(self):
+        return {
+            "type": "function",
+            "function": {"name": self.name, "description": self.description, "parameters": self.parameters},
+        }
+
+
+def normalize_arguments(value):
+    """Canonical form of tool arguments so equivalent calls share a cache entry"""
+    if isinstance(value, dict):
+        return {k: normalize_arguments(v) for k, v in value.items() if v not in (None, "", [], {})}
+    if isinstance(value, list):
+        return [normalize_arguments(v) for v in value]
+    if isinstance(value, str):
+        return " ".join(value.lower().split())
+    return value
+
+
+class ToolRegistry:
+    """
+    Tools declared once with their JSON schema, timeout and caching policy.
+
+    Arguments are validated against the precompiled schema before the handler
+    runs, and results of cacheable tools are kept per user and normalized
+    arguments for ``cache_ttl`` seconds, or until ``forget`` is called for the tool.
+    """
+
+    def __init__(self, cache_size=1024):
+        self.tools = {}
+        self.cache = LRUCache(max_entries=cache_size)
+        # Part of each cache key; bumping a tool's generation orphans its cached results
+        self.generations = {}
+
+    def register(self, name, description, parameters=None, timeout=None, cache_ttl=None):
+        parameters = parameters or {"type": "object", "properties": {}}
+
+        def decorator(func):
+            self.tools[name] = Tool(name, description, parameters, tool_to_async(func), timeout, cache_ttl)
+            return func
+
+        return decorator
+
+    def forget(self, name):
+        """Stop serving cached results of tool ``name`` in this worker"""
+        self.generations[name] = self.generations.get(name, 0) + 1
+
+    def schemas(self):
+        """Tool definitions in the OpenAI ``tools`` format"""
+        return [tool.schema for tool in self.tools.values()]
+
+    async def dispatch(self, name, arguments, user_id):
+        tool = self.tools.get(name)
+        if tool is None:
+            raise ToolError(f"Unknown tool {name!r}")
+        try:
+            params = json.loads(arguments or "{}")
+        except json.JSONDecodeError as e:
+            raise ToolError(f"Arguments for {name} are not valid JSON: {e}")
+        error = next(tool.validator.iter_errors(params), None)
+        if error is not None:
+            raise ToolError(f"Invalid arguments for {name}: {error.message}")
+
+        if tool.cache_ttl:
+            key = (name, self.generations.get(name, 0), user_id, json.dumps(normalize_arguments(params), sort_keys=True))
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        try:
+            result = await asyncio.wait_for(tool.handler(params, user_id), timeout=tool.timeout or settings.CHATBOT['TOOL_TIMEOUT'])
+        except asyncio.TimeoutError:
+            raise ToolError(f"{name} timed out")
+
+        if tool.cache_ttl:
+            self.cache.set(key, result, ttl=tool.cache_ttl)
+        return result
+
+    async def run(self, tool_call, user_id):
+        """Run a model's tool call, turning failures into a result the model can read"""
+        try:
+            return await self.dispatch(tool_call.function.name, tool_call.function.arguments, user_id)
+        except Exception as e:
+            return f"Error running tool: {str(e)}"
+
+
+registry = ToolRegistry()
+
+
+def encode_search_cursor(params, offset):
+    """Continuation token carrying the search filters and where the next page starts"""
+    raw = json.dumps({"params": params, "offset": offset}, sort_keys=True)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    """Return ``(params, offset)``; raises ValueError if the token is malformed"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        params, offset = data["params"], data["offset"]
+    except (TypeError, KeyError, binascii.Error, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if not isinstance(params, dict) or type(offset) is not int or offset < 0:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return params, offset
 
 
-@database_sync_to_async
-def show_order_details(params):
-    # Replace with real order details logic
+SEARCH_FILTERS = ("category", "price_limit", "keyword", "description")
+
+
+def search_filters(params):
+    """
+    The filters of a search, checked and with ``price_limit`` as a float. Cursors
+    and the REST paths reach ``search_products`` without the registry's schema
+    check, and the backends below it expect these types; raises ToolError.
+    """
+    filters = {k: v for k, v in params.items() if k in SEARCH_FILTERS and v not in (None, "")}
+    for key in ("category", "keyword", "description"):
+        if key in filters and not isinstance(filters[key], str):
+            raise ToolError(f"Invalid {key}: expected a string")
+    if "price_limit" in filters:
+        price_limit = filters["price_limit"]
+        try:
+            if isinstance(price_limit, bool):
+                raise ValueError(price_limit)
+            filters["price_limit"] = float(price_limit)
+        except (TypeError, ValueError):
+            raise ToolError(f"Invalid price_limit: {price_limit!r} is not a number")
+        if not math.isfinite(filters["price_limit"]):
+            raise ToolError(f"Invalid price_limit: {price_limit!r} is not a number")
+    return filters
+
+
+def product_thumbnail(name):
+    return Product._meta.get_field("image").storage.url(name) if name else None
+
+
+@registry.register(
+    "search_products",
+    "Search for products by category, price limit, or keyword. Use 'description' instead of "
+    "'keyword' when the user describes what they want loosely (e.g. 'something for gaming'). "
+    "Results come in pages; pass the returned 'next' token as 'cursor' to get more.",
+    {
+        "type": "object",
+        "properties": {
+            "category": {"type": "string"},
+            "price_limit": {"type": "number"},
+            "keyword": {"type": "string"},
+            "description": {"type": "string"},
+            "cursor": {"type": "string"},
+        },
+        "required": [],
+    },
+    # Other workers only see a product change once their snapshot refreshes; cached pages expire with it
+    cache_ttl=settings.CHATBOT["CATALOG_SNAPSHOT_MAX_STALENESS"],
+)
+def search_products(params, user_id):
+    """
+    One page of matching products, best matches first, as compact rows
+    (id, name, current price, thumbnail) plus a ``next`` token, or None on the
+    last page. Pages stop after SEARCH_MAX_RESULTS, so a broad query costs the
+    same as a narrow one.
+    """
+    page_size = settings.CHATBOT["SEARCH_PAGE_SIZE"]
+    offset = 0
+    if params.get("cursor"):
+        try:
+            params, offset = decode_search_cursor(params["cursor"])
+        except ValueError as e:
+            raise ToolError(str(e))
+    params = search_filters(params)
+
+    limit = min(page_size, settings.CHATBOT["SEARCH_MAX_RESULTS"] - offset)
+    if limit <= 0:
+        rows, more = [], False
+    elif params.get("keyword"):
+        # Keyword searches go through the full-text index, ranked by relevance
+        rows = product_search.search_products(
+            params["keyword"], params.get("category"), params.get("price_limit"), limit=limit + 1, offset=offset,
+        )
+        more = len(rows) > limit
+    elif params.get("description"):
+        # Loose descriptions go through the local embedding index, nearest first,
+        # or the full-text index until the embedding index has been built
+        rows = semantic.search_products(
+            params["description"], params.get("category"), params.get("price_limit"), limit=limit + 1, offset=offset,
+        )
+        if rows is None:
+            rows = product_search.search_products(
+                params["description"], params.get("category"), params.get("price_limit"), limit=limit + 1, offset=offset,
+            )
+        more = len(rows) > limit
+    elif settings.CHATBOT["CATALOG_SNAPSHOT"]:
+        rows, more = catalog_snapshot.query(params.get("category"), params.get("price_limit"), limit=limit, offset=offset)
+    else:
+        products = Product.objects.filter(is_active=True).annotate(current_price=Coalesce("discount_price", "price"))
+        if params.get("category"):
+            products = products.filter(category__name__icontains=params["category"])
+        if params.get("price_limit") is not None:
+            products = products.filter(current_price__lte=params["price_limit"])
+        # Featured and in-stock products first, then the cheapest
+        in_stock = Case(When(stock__gt=0, then=Value(1)), default=Value(0), output_field=IntegerField())
+        products = products.order_by("-is_featured", in_stock.desc(), "current_price", "id")
+        rows = list(products.values("id", "name", "current_price", "image")[offset:offset + limit + 1])
+        more = len(rows) > limit
+    has_more = more and offset + limit < settings.CHATBOT["SEARCH_MAX_RESULTS"]
     return {
-        "order_id": params.get("order_id"),
-        "items": [
-            {"id": 1, "name": "Phone X", "price": 999, "quantity": 1},
+        "products": [
+            {"id": row["id"], "name": row["name"], "price": float(row["current_price"]), "thumbnail": product_thumbnail(row["image"])}
+            for row in rows[:limit]
         ],
-        "status": "shipped",
+        "next": encode_search_cursor(params, offset + limit) if has_more else None,
     }
 
 
-#  tools for OpenAI API
-tools = [
+@registry.register(
+    "add_to_cart",
+    "Add a product to the user's cart, or several at once with 'items'.",
     {
-        "type": "function",
-        "function": {
-            "name": "search_products",
-            "description": "Search for products by category, price limit, or keyword.",
-            "parameters": {
-                "type": "object",
-                "properties": {"category": {"type": "string"}, "price_limit": {"type": "number"}, "keyword": {"type": "string"}},
-                "required": [],
+        "type": "object",
+        "properties": {
+            "product_id": {"type": "integer"},
+            "quantity": {"type": "integer", "minimum": 1},
+            "items": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"product_id": {"type": "integer"}, "quantity": {"type": "integer", "minimum": 1}},
+                    "required": ["product_id"],
+                },
             },
         },
+        "required": [],
     },
+)
+def add_to_cart(params, user_id):
+    if user_id is None:
+        raise ToolError("The user must be signed in to add to the cart.")
+    items = [(item["product_id"], item.get("quantity", 1)) for item in params.get("items", [])]
+    if "product_id" in params:
+        items.append((params["product_id"], params.get("quantity", 1)))
+    try:
+        added = cart_services.add_items(user_id, items)
+    except CartError as e:
+        return {"success": False, "message": str(e)}
+    return {
+        "success": True,
+        "message": "Added " + ", ".join(f"{item['name']} (now {item['quantity']} in cart)" for item in added) + ".",
+        "items": added,
+    }
+
+
+@registry.register("show_cart", "Show the user's current cart details.")
+def show_cart(params, user_id):
+    if user_id is None:
+        raise ToolError("The user must be signed in to see the cart.")
+    return cart_services.cart_summary(user_id)
+
+
+@registry.register(
+    "show_order_details",
+    "Show details and status of one of the user's orders, by id or order number; "
+    "without either, their most recent order.",
     {
-        "type": "function",
-        "function": {
-            "name": "add_to_cart",
-            "description": "Add a product to the user's cart.",
-            "parameters": {"type": "object", "properties": {"product_id": {"type": "integer"}, "quantity": {"type": "integer"}}, "required": ["product_id"]},
-        },
-    },
-    {
-        "type": "function",
-        "function": {"name": "show_cart", "description": "Show the user's current cart details.", "parameters": {"type": "object", "properties": {}}},
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "show_order_details",
-            "description": "Show details for a specific order.",
-            "parameters": {"type": "object", "properties": {"order_id": {"type": "integer"}}, "required": ["order_id"]},
-        },
+        "type": "object",
+        "properties": {"order_id": {"type": "integer"}, "order_number": {"type": "string"}},
+        "required": [],
     },
-]
+)
+def show_order_details(params, user_id):
+    if user_id is None:
+        raise ToolError("The user must be signed in to see their orders.")
+    try:
+        return order_services.order_details(user_id, params.get("order_id"), params.get("order_number"))
+    except Order.DoesNotExist:
+        raise ToolError("No such order for this user.")
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Product)
+@receiver(post_delete, sender=Category)
+def forget_search_results(sender, instance, **kwargs):
+    # Prices, stock and names in cached pages may have changed
+    registry.forget("search_products")
+
+
+#  tools for OpenAI API
+tools = registry.schemas()
@@ -0,0 +1,70 @@
+import base64
+import binascii
+import json
+
+from django.utils.dateparse import parse_datetime
+
+from .cache import LRUCache
+from .context import summary_message
+
+SYSTEM_PROMPT = (
+    "You are an e-commerce assistant chatbot. "
+    "You can help users search for products, add items to their cart, "
+    "show cart details, and provide order information. "
+    "Always be helpful and concise."
+)
+
+# Rough per-message bookkeeping cost (dict + role string) on top of the content.
+MESSAGE_OVERHEAD_BYTES = 200
+
+
+def history_size(messages):
+    """Approximate memory footprint of a message list in bytes"""
+    return sum(len(m.get("content") or "") + MESSAGE_OVERHEAD_BYTES for m in messages)
+
+
+class SessionHistoryStore(LRUCache):
+    """
+    Per-worker cache of ``(message list, version)`` pairs keyed by session id.
+
+    Sessions are evicted least-recently-used first once the session count or
+    the approximate memory budget is exceeded, and after sitting idle for the
+    configured TTL.  An evicted session is rebuilt from ``ChatMessage`` rows
+    the next time it is needed.
+    """
+
+    def __init__(self, max_sessions, idle_ttl, max_bytes):
+        super().__init__(max_entries=max_sessions, ttl=idle_ttl, max_size=max_bytes, sizeof=lambda entry: history_size(entry[0]), sliding=True)
+
+
+def history_from_messages(messages, summary=""):
+    """Build an LLM message list from the session summary and the stored ChatMessage values after it"""
+    history = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if summary:
+        history.append(summary_message(summary))
+    history += [
+        {"role": "user" if m["message_type"] == "user" else "assistant", "content": m["content"]}
+        for m in messages
+    ]
+    return history
+
+
+def encode_cursor(message):
+    """Opaque pagination cursor pointing just before ``message``"""
+    raw = json.dumps([message.timestamp.isoformat(), message.pk])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return ``(timestamp, id)`` from a cursor; raises ValueError if it is malformed"""
+    if not isinstance(cursor, str):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    try:
+        timestamp, pk = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        timestamp = parse_datetime(timestamp)
+    except (TypeError, ValueError, binascii.Error, json.JSONDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+    if timestamp is None or not isinstance(pk, int):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+    return timestamp, pk
+
@@ -0,0 +1,210 @@
+"""
+Local intent classifier for the REST chat endpoint.
+
+Messages are turned into hashed n-gram features (word unigrams and bigrams,
+character trigrams, numbers collapsed to one token) and scored by a softmax
+linear model in NumPy. Slots (category, price limit) are pulled out with a
+regex and the catalogue's category names. ``IntentRouter.route`` returns an
+intent only when the model is confident and the slots the intent needs are
+present; anything else goes to the LLM.
+
+The model is trained by ``manage.py train_intent_classifier`` and stored at
+``CHATBOT['INTENT_MODEL_PATH']``. Until that file exists the fast path is off.
+"""
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+from django.conf import settings
+
+from products.models import Category
+
+from .cache import LRUCache
+
+INTENTS = ['search_product', 'show_cart', 'order_status', 'greeting', 'other']
+
+_WORD_RE = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)*")
+_NUMBER_RE = re.compile(r"^[0-9][0-9.,]*$")
+_PRICE_RE = re.compile(
+    r"(?:under|below|less than|cheaper than|up ?to|within|max(?:imum)?|budget(?: of)?|<)\s*"
+    r"(?:rs\.?|inr|₹|\$)?\s*([0-9][0-9,]*(?:\.[0-9]+)?)\s*(k\b)?",
+    re.IGNORECASE,
+)
+
+
+def tokenize(text):
+    text = text.lower().replace("'", "").replace("\u2019", "")
+    return ['<num>' if _NUMBER_RE.match(word) else word for word in _WORD_RE.findall(text)]
+
+
+def hash_features(text, dim):
+    """Return ``(indices, values)`` of the L2-normalized hashed n-gram vector of ``text``"""
+    words = tokenize(text)
+    features = [f'w:{w}' for w in words]
+    features += [f'b:{a} {b}' for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f'^{word}$'
+        features += [f'c:{padded[i:i + 3]}' for i in range(len(padded) - 2)]
+    if not features:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+    # crc32 rather than hash(), which is salted per process
+    buckets = np.fromiter((zlib.crc32(f.encode()) % dim for f in features), dtype=np.int64, count=len(features))
+    indices, counts = np.unique(buckets, return_counts=True)
+    values = counts.astype(np.float32)
+    return indices, values / np.linalg.norm(values)
+
+
+def _batch(samples):
+    """Stack per-sample sparse features into (rows, cols, vals) triples"""
+    rows = np.concatenate([np.full(len(idx), i, dtype=np.int64) for i, (idx, _) in enumerate(samples)])
+    cols = np.concatenate([idx for idx, _ in samples])
+    vals = np.concatenate([val for _, val in samples])
+    return rows, cols, vals
+
+
+def _softmax(logits):
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+class IntentClassifier:
+    """Multinomial logistic regression over hashed sparse features"""
+
+    def __init__(self, labels, dim=2 ** 16):
+        self.labels = list(labels)
+        self.dim = dim
+        self.weights = np.zeros((dim, len(self.labels)), dtype=np.float32)
+        self.bias = np.zeros(len(self.labels), dtype=np.float32)
+
+    def fit(self, texts, labels, epochs=30, learning_rate=5.0, l2=1e-6, batch_size=256, seed=0):
+        samples = [hash_features(text, self.dim) for text in texts]
+        targets = np.array([self.labels.index(label) for label in labels])
+        rng = np.random.default_rng(seed)
+        for _ in range(epochs):
+            order = rng.permutation(len(samples))
+            for start in range(0, len(order), batch_size):
+                chunk = order[start:start + batch_size]
+                rows, cols, vals = _batch([samples[i] for i in chunk])
+                logits = np.zeros((len(chunk), len(self.labels)), dtype=np.float32)
+                np.add.at(logits, rows, vals[:, None] * self.weights[cols])
+                grad = _softmax(logits + self.bias)
+                grad[np.arange(len(chunk)), targets[chunk]] -= 1
+                grad /= len(chunk)
+                grad_weights = np.zeros_like(self.weights)
+                np.add.at(grad_weights, cols, vals[:, None] * grad[rows])
+                self.weights -= learning_rate * (grad_weights + l2 * self.weights)
+                self.bias -= learning_rate * grad.sum(axis=0)
+        return self
+
+    def predict_proba(self, text):
+        indices, values = hash_features(text, self.dim)
+        logits = values @ self.weights[indices] + self.bias
+        return _softmax(logits[None, :])[0]
+
+    def predict(self, text):
+        """Return ``(intent, confidence)``"""
+        proba = self.predict_proba(text)
+        best = int(proba.argmax())
+        return self.labels[best], float(proba[best])
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, weights=self.weights, bias=self.bias, labels=np.array(self.labels))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            classifier = cls(data['labels'].tolist(), dim=data['weights'].shape[0])
+            classifier.weights = data['weights']
+            classifier.bias = data['bias']
+        return classifier
+
+
+def extract_price_limit(text):
+    match = _PRICE_RE.search(text)
+    if not match:
+        return None
+    value = float(match.group(1).replace(',', ''))
+    if match.group(2):
+        value *= 1000
+    return int(value) if value.is_integer() else value
+
+
+def extract_category(text, category_names):
+    """
+    Longest category mentioned in ``text``, allowing a plural 's'.
+    ``category_names`` maps tokenized names to the names stored on ``Category``.
+    """
+    words = ' '.join(tokenize(text))
+    for key in sorted(category_names, key=len, reverse=True):
+        if re.search(rf'\b{re.escape(key)}s?\b', words):
+            return category_names[key]
+    return None
+
+
+class IntentRouter:
+    """
+    Per-worker fast path: classify a message and, when confident, return the
+    intent and its slots. The model file is reloaded when it changes on disk.
+    """
+
+    def __init__(self, model_path, threshold):
+        self.model_path = model_path
+        self.threshold = threshold
+        self.classifier = None
+        self.loaded_mtime = None
+        self.routed = self.fallbacks = 0
+        self._categories = LRUCache(max_entries=1, ttl=300)
+        self._lock = threading.Lock()
+
+    def route(self, text, intents=INTENTS):
+        """Return ``(intent, params)`` for a confident prediction among ``intents``, else ``None``"""
+        classifier = self.get_classifier()
+        if classifier is None:
+            return None
+        intent, confidence = classifier.predict(text)
+        params = {}
+        if intent == 'search_product':
+            category = extract_category(text, self.category_names())
+            price_limit = extract_price_limit(text)
+            if category:
+                params['category'] = category
+            if price_limit is not None:
+                params['price_limit'] = price_limit
+        # Without a known category the LLM has to work out what to look for
+        if confidence < self.threshold or intent == 'other' or intent not in intents or (intent == 'search_product' and 'category' not in params):
+            self.fallbacks += 1
+            return None
+        self.routed += 1
+        return intent, params
+
+    def get_classifier(self):
+        try:
+            mtime = os.stat(self.model_path).st_mtime
+        except OSError:
+            return None
+        with self._lock:
+            if mtime != self.loaded_mtime:
+                try:
+                    self.classifier = IntentClassifier.load(self.model_path)
+                except Exception as e:
+                    print(f"Error loading intent model {self.model_path}: {e}")
+                    self.classifier = None
+                self.loaded_mtime = mtime
+            return self.classifier
+
+    def category_names(self):
+        names = self._categories.get('names')
+        if names is None:
+            names = {' '.join(tokenize(name)): name for name in Category.objects.filter(is_active=True).values_list('name', flat=True)}
+            self._categories.set('names', names)
+        return names
+
+    def stats(self):
+        return {'model_loaded': self.classifier is not None, 'routed': self.routed, 'fallbacks': self.fallbacks}
+
+
+intent_router = IntentRouter(settings.CHATBOT['INTENT_MODEL_PATH'], settings.CHATBOT['INTENT_CONFIDENCE'])
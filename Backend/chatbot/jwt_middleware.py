@@ -1,42 +1,96 @@
+import hashlib
+import time
+
 from channels.middleware import BaseMiddleware
-from rest_framework_simplejwt.tokens import AccessToken
 from channels.db import database_sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .cache import LRUCache
+
+# Verified tokens (sha256 of the token -> user id), each kept until the token's own expiry
+verified_tokens = LRUCache(max_entries=settings.CHATBOT['JWT_CACHE_MAX_ENTRIES'])
+# Active users resolved for verified tokens, dropped whenever the user row changes
+users = LRUCache(max_entries=settings.CHATBOT['JWT_CACHE_MAX_ENTRIES'], ttl=settings.CHATBOT['JWT_USER_CACHE_TTL'])
+
 
 class JWTAuthMiddleware(BaseMiddleware):
-    
+
     async def __call__(self, scope, receive, send):
-    
+
         token = self.get_token_from_scope(scope)
-        
+
         if token != None:
-            user_id = await self.get_user_from_token(token) 
-            if user_id:
-                scope['user_id'] = user_id
+            user = await authenticate(token)
+            if user:
+                scope['user_id'] = user.pk
+                scope['user'] = user
 
             else:
                 scope['error'] = 'Invalid token'
 
         if token == None:
-            scope['error'] = 'provide an auth token'    
-    
-                
+            scope['error'] = 'provide an auth token'
+
+
         return await super().__call__(scope, receive, send)
 
     def get_token_from_scope(self, scope):
         headers = dict(scope.get("headers", []))
-        
+
         auth_header = headers.get(b'authorization', b'').decode('utf-8')
-        
+
         if auth_header.startswith('Bearer '):
             return auth_header.split(' ')[1]
-        
+
         else:
             return None
-        
-    @database_sync_to_async
-    def get_user_from_token(self, token):
-            try:
-                access_token = AccessToken(token)
-                return access_token['user_id']
-            except:
-                return None
\ No newline at end of file
+
+
+def verify_token(token):
+    """
+    Return the user id of a valid access token, or None. Verified inline: an
+    HS256 check is pure CPU and cheaper than a thread hop. A token seen before
+    is trusted until its ``exp``.
+    """
+    key = hashlib.sha256(token.encode()).hexdigest()
+    user_id = verified_tokens.get(key)
+    if user_id is not None:
+        return user_id
+    try:
+        access_token = AccessToken(token)
+        user_id = access_token['user_id']
+    except Exception:
+        return None
+    verified_tokens.set(key, user_id, ttl=max(access_token['exp'] - time.time(), 0))
+    return user_id
+
+
+async def get_user(user_id):
+    user = users.get(user_id)
+    if user is None:
+        user = await load_user(user_id)
+        if user is not None:
+            users.set(user_id, user)
+    return user
+
+
+@database_sync_to_async
+def load_user(user_id):
+    return get_user_model().objects.filter(pk=user_id, is_active=True).first()
+
+
+async def authenticate(token):
+    """The active user a bearer token belongs to, or None"""
+    user_id = verify_token(token)
+    return await get_user(user_id) if user_id else None
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def forget_user(sender, instance, **kwargs):
+    # Deactivated or deleted users lose websocket access even with an unexpired token
+    users.pop(instance.pk)
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+LLM clients shared by the chatbot.
+
+The OpenAI SDK clients are built lazily on top of pooled, keep-alive httpx
+transports so that concurrent chats reuse the same upstream connections.
+The websocket consumer uses the async client, which never blocks the event
+loop; httpx async pools are tied to the event loop that created them, so one
+async client is kept per running loop.  Synchronous DRF views share a single
+thread-safe sync client.
+
+Assistant replies are looked up in the response cache before going upstream.
+The backend producing the clients is pluggable through CHATBOT_LLM['BACKEND'];
+``chatbot.llm_stub.StubBackend`` answers offline for load tests.
+"""
+import asyncio
+import threading
+import weakref
+
+import httpx
+from django.conf import settings
+from django.utils.module_loading import import_string
+from openai import AsyncOpenAI, OpenAI
+from openai.types.chat import ChatCompletionMessage
+
+from .response_cache import cache_key, is_cacheable, response_cache
+
+_clients = weakref.WeakKeyDictionary()
+_sync_client = None
+_sync_client_lock = threading.Lock()
+
+
+def _pool_options():
+    conf = settings.CHATBOT_LLM
+    return {
+        'limits': httpx.Limits(
+            max_connections=conf['MAX_CONNECTIONS'],
+            max_keepalive_connections=conf['MAX_KEEPALIVE_CONNECTIONS'],
+            keepalive_expiry=conf['KEEPALIVE_EXPIRY'],
+        ),
+        'timeout': httpx.Timeout(conf['TIMEOUT'], connect=conf['CONNECT_TIMEOUT']),
+    }
+
+
+def _client_options(base_url, api_key):
+    conf = settings.CHATBOT_LLM
+    return {
+        'base_url': base_url or conf['ENDPOINT'],
+        'api_key': api_key or conf['API_KEY'] or 'missing',
+        'max_retries': conf['MAX_RETRIES'],
+    }
+
+
+def build_async_client(base_url=None, api_key=None):
+    """Create an AsyncOpenAI client with a pooled keep-alive HTTP transport"""
+    return AsyncOpenAI(http_client=httpx.AsyncClient(**_pool_options()), **_client_options(base_url, api_key))
+
+
+def build_client(base_url=None, api_key=None):
+    """Create a thread-safe OpenAI client with a pooled keep-alive HTTP transport"""
+    return OpenAI(http_client=httpx.Client(**_pool_options()), **_client_options(base_url, api_key))
+
+
+class OpenAIBackend:
+    """Default backend: the OpenAI-compatible endpoint configured in CHATBOT_LLM"""
+
+    def async_client(self):
+        return build_async_client()
+
+    def sync_client(self):
+        return build_client()
+
+
+def get_backend():
+    """Instantiate the backend class named by CHATBOT_LLM['BACKEND']"""
+    return import_string(settings.CHATBOT_LLM['BACKEND'])()
+
+
+def get_async_client():
+    """Return the client bound to the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = get_backend().async_client()
+    return client
+
+
+def get_client():
+    """Return the process-wide sync client, creating it on first use"""
+    global _sync_client
+    if _sync_client is None:
+        with _sync_client_lock:
+            if _sync_client is None:
+                _sync_client = get_backend().sync_client()
+    return _sync_client
+
+
+def _request_options(timeout, kwargs):
+    conf = settings.CHATBOT_LLM
+    kwargs.setdefault('model', conf['MODEL'])
+    kwargs['timeout'] = timeout if timeout is not None else conf['TIMEOUT']
+    return kwargs
+
+
+def _response_cache_key(messages, kwargs):
+    if not settings.CHATBOT_LLM['RESPONSE_CACHE_TTL'] or not is_cacheable(messages):
+        return None
+    return cache_key(messages, {k: v for k, v in kwargs.items() if k != 'timeout'})
+
+
+async def acomplete(messages, timeout=None, **kwargs):
+    """
+    Run a chat completion without blocking the event loop.
+    ``timeout`` (seconds) overrides the configured per-call timeout.
+    """
+    return await get_async_client().chat.completions.create(messages=messages, **_request_options(timeout, kwargs))
+
+
+def complete(messages, timeout=None, **kwargs):
+    """Run a chat completion on the calling thread, for synchronous views"""
+    return get_client().chat.completions.create(messages=messages, **_request_options(timeout, kwargs))
+
+
+async def acomplete_message(messages, on_delta=None, timeout=None, **kwargs):
+    """
+    Run a chat completion and return the assistant message.
+
+    When ``on_delta`` is given the completion is streamed: every content
+    delta is awaited through ``on_delta(text)`` as it arrives, and the
+    content and tool calls are reassembled into a regular message.  A cached
+    reply is delivered as a single delta.
+    """
+    key = _response_cache_key(messages, _request_options(timeout, dict(kwargs)))
+    if key is not None:
+        message = response_cache.get(key)
+        if message is not None:
+            if on_delta is not None and message.content:
+                await on_delta(message.content)
+            return message
+
+    if on_delta is None:
+        response = await acomplete(messages, timeout=timeout, **kwargs)
+        message = response.choices[0].message
+    else:
+        message = await _stream_message(messages, on_delta, timeout, kwargs)
+
+    if key is not None:
+        response_cache.set(key, message)
+    return message
+
+
+def complete_message(messages, timeout=None, **kwargs):
+    """Synchronous counterpart of ``acomplete_message`` without streaming"""
+    key = _response_cache_key(messages, _request_options(timeout, dict(kwargs)))
+    if key is not None:
+        message = response_cache.get(key)
+        if message is not None:
+            return message
+    message = complete(messages, timeout=timeout, **kwargs).choices[0].message
+    if key is not None:
+        response_cache.set(key, message)
+    return message
+
+
+async def _stream_message(messages, on_delta, timeout, kwargs):
+    stream = await acomplete(messages, timeout=timeout, stream=True, **kwargs)
+    content = []
+    tool_calls = {}
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content.append(delta.content)
+            await on_delta(delta.content)
+        for call in delta.tool_calls or []:
+            # Tool calls arrive in fragments keyed by index; the arguments
+            # string is split across chunks.
+            entry = tool_calls.setdefault(call.index, {'id': None, 'type': 'function', 'function': {'name': '', 'arguments': ''}})
+            if call.id:
+                entry['id'] = call.id
+            if call.function:
+                entry['function']['name'] += call.function.name or ''
+                entry['function']['arguments'] += call.function.arguments or ''
+    return ChatCompletionMessage.model_validate({
+        'role': 'assistant',
+        'content': ''.join(content) or None,
+        'tool_calls': [tool_calls[i] for i in sorted(tool_calls)] or None,
+    })
@@ -0,0 +1,135 @@
+"""
+Deterministic offline LLM backend for load tests and local development.
+
+Enable it with ``CHATBOT_LLM['BACKEND'] = 'chatbot.llm_stub.StubBackend'``.
+Replies are derived from the last user message, arrive after a configurable
+latency and at a configurable token rate, and tool calls are scripted by
+matching the user message against regular expressions::
+
+    CHATBOT_LLM['STUB'] = {
+        'LATENCY': 0.3,             # seconds before the first token
+        'TOKENS_PER_SECOND': 50,
+        'REPLY_TOKENS': 40,
+        'TOOL_SCRIPTS': [
+            {'pattern': r'\\bcart\\b', 'tool': 'show_cart', 'arguments': {}},
+        ],
+    }
+"""
+import asyncio
+import itertools
+import json
+import re
+import time
+
+from django.conf import settings
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+DEFAULTS = {
+    'LATENCY': 0.3,
+    'TOKENS_PER_SECOND': 50,
+    'REPLY_TOKENS': 40,
+    'TOOL_SCRIPTS': [],
+}
+
+_ids = itertools.count(1)
+
+
+class StubCompletions:
+    def __init__(self, options):
+        self.latency = options['LATENCY']
+        self.tokens_per_second = options['TOKENS_PER_SECOND']
+        self.reply_tokens = options['REPLY_TOKENS']
+        self.scripts = [
+            (re.compile(script['pattern'], re.IGNORECASE), script['tool'], script.get('arguments', {}))
+            for script in options['TOOL_SCRIPTS']
+        ]
+
+    def plan(self, messages, tools):
+        """Decide the reply for a prompt: ``(content tokens, tool calls)``"""
+        last = messages[-1] if messages else {'role': 'user', 'content': ''}
+        if tools and last['role'] == 'user':
+            calls = [
+                {'id': f'call_{next(_ids)}', 'type': 'function', 'function': {'name': tool, 'arguments': json.dumps(arguments)}}
+                for pattern, tool, arguments in self.scripts
+                if pattern.search(last.get('content') or '')
+            ]
+            if calls:
+                return [], calls
+        if last['role'] == 'tool':
+            tools_used = sum(1 for m in messages if m['role'] == 'tool')
+            words = f'Here is what I found from {tools_used} tool results.'.split()
+        else:
+            words = f'Stub reply to: {last.get("content") or ""}'.split()
+        filler = (f'token{i}' for i in itertools.count())
+        while len(words) < self.reply_tokens:
+            words.append(next(filler))
+        return [word + ' ' for word in words], None
+
+    def completion(self, content, tool_calls):
+        return ChatCompletion.model_validate({
+            'id': f'stub-{next(_ids)}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': 'stub',
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'tool_calls' if tool_calls else 'stop',
+                'message': {'role': 'assistant', 'content': ''.join(content) or None, 'tool_calls': tool_calls},
+            }],
+        })
+
+    def chunk(self, delta, finish_reason=None):
+        return ChatCompletionChunk.model_validate({
+            'id': 'stub-stream',
+            'object': 'chat.completion.chunk',
+            'created': int(time.time()),
+            'model': 'stub',
+            'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}],
+        })
+
+
+class AsyncStubCompletions(StubCompletions):
+    async def create(self, messages, tools=None, stream=False, **kwargs):
+        content, tool_calls = self.plan(messages, tools)
+        await asyncio.sleep(self.latency)
+        if not stream:
+            await asyncio.sleep(len(content) / self.tokens_per_second)
+            return self.completion(content, tool_calls)
+        return self.stream(content, tool_calls)
+
+    async def stream(self, content, tool_calls):
+        yield self.chunk({'role': 'assistant'})
+        for token in content:
+            yield self.chunk({'content': token})
+            await asyncio.sleep(1 / self.tokens_per_second)
+        for index, call in enumerate(tool_calls or []):
+            yield self.chunk({'tool_calls': [dict(call, index=index)]})
+        yield self.chunk({}, 'tool_calls' if tool_calls else 'stop')
+
+
+class SyncStubCompletions(StubCompletions):
+    def create(self, messages, tools=None, stream=False, **kwargs):
+        content, tool_calls = self.plan(messages, tools)
+        time.sleep(self.latency + len(content) / self.tokens_per_second)
+        return self.completion(content, tool_calls)
+
+
+class StubClient:
+    """Stands in for ``OpenAI`` / ``AsyncOpenAI``: only ``chat.completions.create`` is provided"""
+
+    def __init__(self, completions):
+        self.chat = type('Chat', (), {'completions': completions})()
+
+    async def close(self):
+        pass
+
+
+class StubBackend:
+    def __init__(self):
+        self.options = {**DEFAULTS, **settings.CHATBOT_LLM.get('STUB', {})}
+
+    def async_client(self):
+        return StubClient(AsyncStubCompletions(self.options))
+
+    def sync_client(self):
+        return StubClient(SyncStubCompletions(self.options))
@@ -0,0 +1,105 @@
+import asyncio
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot.llm import build_async_client
+
+
+class StubCompletionServer:
+    """Minimal keep-alive HTTP server answering every request with a canned chat completion"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.connections = 0
+        self.requests = 0
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, '127.0.0.1', 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                length = 0
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    if name.strip().lower() == 'content-length':
+                        length = int(value.strip())
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                body = json.dumps({
+                    'id': f'chatcmpl-{self.requests}',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': 'stub',
+                    'choices': [{
+                        'index': 0,
+                        'finish_reason': 'stop',
+                        'message': {'role': 'assistant', 'content': 'Stub reply.'},
+                    }],
+                }).encode()
+                writer.write(
+                    b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class Command(BaseCommand):
+    help = 'Benchmark concurrent chat sessions through the async LLM client against a local stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=200, help='Concurrent chat sessions')
+        parser.add_argument('--turns', type=int, default=3, help='Completions per session')
+        parser.add_argument('--latency', type=float, default=0.2, help='Stub completion latency in seconds')
+
+    def handle(self, *args, **options):
+        asyncio.run(self.run(options['sessions'], options['turns'], options['latency']))
+
+    async def run(self, sessions, turns, latency):
+        stub = StubCompletionServer(latency)
+        port = await stub.start()
+        client = build_async_client(base_url=f'http://127.0.0.1:{port}/v1', api_key='bench')
+
+        async def session():
+            messages = [{'role': 'user', 'content': 'hello'}]
+            for _ in range(turns):
+                await client.chat.completions.create(model='stub', messages=messages)
+
+        try:
+            baseline = None
+            for concurrency in (1, sessions):
+                stub.connections = stub.requests = 0
+                start = time.perf_counter()
+                await asyncio.gather(*(session() for _ in range(concurrency)))
+                elapsed = time.perf_counter() - start
+                throughput = stub.requests / elapsed
+                baseline = baseline or throughput
+                self.stdout.write(
+                    f'{concurrency:>5} sessions: {stub.requests} completions in {elapsed:.2f}s, '
+                    f'{throughput:.1f} completions/s ({throughput / baseline:.1f}x), '
+                    f'{stub.connections} new upstream connections'
+                )
+        finally:
+            await client.close()
+            await stub.stop()
@@ -0,0 +1,92 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from chatbot.management.commands.chatbot_loadtest import percentile
+from products import search as product_search
+from products.models import Category, Product
+
+BENCH_SKU = 'BENCH-{}'
+BRANDS = ['acme', 'nova', 'zenith', 'orbit', 'pixel', 'vertex', 'lumen', 'apex', 'nimbus', 'quantum']
+ADJECTIVES = ['wireless', 'smart', 'portable', 'classic', 'ultra', 'slim', 'pro', 'eco', 'rugged', 'compact']
+NOUNS = ['phone', 'laptop', 'headphones', 'watch', 'camera', 'speaker', 'tablet', 'keyboard', 'monitor', 'charger',
+         'shoes', 'jacket', 'backpack', 'bottle', 'lamp', 'chair', 'desk', 'blender', 'kettle', 'router']
+QUERIES = ['wireless headphones', 'smart watch', 'nova laptop', 'portable speaker', 'rugged phone case',
+           'ultra slim monitor', 'eco bottle', 'acme', 'camera', 'pro keyboard']
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed synthetic products (1M by default) and compare chatbot keyword search through the '
+        'full-text index against the LIKE scan it replaces, with and without category and price filters.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=1_000_000, help='Products to seed')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=5, help='Runs of each query')
+        parser.add_argument('--skip-like', action='store_true', help='Only time the full-text index')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded products afterwards')
+
+    def handle(self, *args, **options):
+        existing = Product.objects.filter(sku__startswith=BENCH_SKU.format('')).count()
+        if existing < options['products']:
+            self.seed(existing, options['products'], options['batch_size'])
+        try:
+            cases = [(query, {}) for query in QUERIES]
+            cases += [(query, {'price_limit': 500}) for query in QUERIES[:5]]
+            cases += [(query, {'category': 'Bench phone'}) for query in QUERIES[:5]]
+            self.bench('full-text', product_search.search_products, cases, options['repeat'])
+            if not options['skip_like']:
+                self.bench('LIKE scan', product_search.like_search, cases, max(1, options['repeat'] // 5))
+        finally:
+            if not options['keep']:
+                self.stdout.write('Deleting seeded products...')
+                Product.objects.filter(sku__startswith=BENCH_SKU.format('')).delete()
+                Category.objects.filter(slug__startswith='bench-').delete()
+
+    def seed(self, start, total, batch_size):
+        categories = [
+            Category.objects.get_or_create(slug=f'bench-{noun}', defaults={'name': f'Bench {noun}'})[0]
+            for noun in NOUNS
+        ]
+        rng = random.Random(start)
+        began = time.perf_counter()
+        for offset in range(start, total, batch_size):
+            batch = []
+            for i in range(offset, min(offset + batch_size, total)):
+                noun = rng.randrange(len(NOUNS))
+                name = f'{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} {NOUNS[noun]} {i}'
+                price = rng.randint(100, 100_000) / 100
+                batch.append(Product(
+                    name=name,
+                    slug=f'bench-{i}',
+                    description=f'A {rng.choice(ADJECTIVES)} {NOUNS[noun]} by {rng.choice(BRANDS)} for everyday use.',
+                    category=categories[noun],
+                    price=price,
+                    discount_price=round(price * 0.9, 2) if i % 7 == 0 else None,
+                    stock=rng.randint(0, 50),
+                    image=f'products/bench-{i}.jpg',
+                    sku=BENCH_SKU.format(i),
+                ))
+            # Index triggers fire for every row, so this also measures index maintenance
+            with transaction.atomic():
+                Product.objects.bulk_create(batch)
+            done = min(offset + batch_size, total)
+            self.stdout.write(f'\rSeeded {done}/{total} products ({done / (time.perf_counter() - began):.0f}/s)', ending='')
+            self.stdout.flush()
+        self.stdout.write('')
+
+    def bench(self, label, search, cases, repeat):
+        timings = []
+        for query, filters in cases:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                search(query, limit=11, **filters)
+                timings.append(time.perf_counter() - start)
+        self.stdout.write(
+            f'{label:>10}: {len(timings)} queries, p50 {percentile(timings, 50) * 1000:.1f}ms  '
+            f'p95 {percentile(timings, 95) * 1000:.1f}ms  max {max(timings) * 1000:.1f}ms'
+        )
@@ -0,0 +1,124 @@
+import asyncio
+import json
+import time
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from chatbot.jwt_middleware import JWTAuthMiddleware
+from chatbot.models import ChatbotSession
+from chatbot.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+LOADTEST_EMAIL = 'loadtest-{}@example.com'
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Open N concurrent websocket chat sessions through JWTAuthMiddleware and ChatConsumer '
+        'and report turn latency, time-to-first-byte and throughput. Uses the offline stub LLM by default.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=50, help='Concurrent websocket sessions')
+        parser.add_argument('--turns', type=int, default=5, help='Messages sent per session')
+        parser.add_argument('--message', action='append', help='Message text, cycled per turn (repeatable)')
+        parser.add_argument('--stream', action='store_true', help='Request streamed replies')
+        parser.add_argument('--backend', default='chatbot.llm_stub.StubBackend', help='LLM backend class to load-test against')
+        parser.add_argument('--latency', type=float, default=0.3, help='Stub latency before the first token, seconds')
+        parser.add_argument('--tokens-per-second', type=float, default=50, help='Stub token rate')
+        parser.add_argument('--response-cache', action='store_true', help='Keep the LLM response cache enabled')
+        parser.add_argument('--keep', action='store_true', help='Keep the load-test sessions and messages afterwards')
+
+    def handle(self, *args, **options):
+        settings.CHATBOT_LLM['BACKEND'] = options['backend']
+        settings.CHATBOT_LLM['STUB'] = {
+            **settings.CHATBOT_LLM.get('STUB', {}),
+            'LATENCY': options['latency'],
+            'TOKENS_PER_SECOND': options['tokens_per_second'],
+            'TOOL_SCRIPTS': settings.CHATBOT_LLM.get('STUB', {}).get('TOOL_SCRIPTS') or [
+                {'pattern': r'\bcart\b', 'tool': 'show_cart', 'arguments': {}},
+                {'pattern': r'\border\b', 'tool': 'show_order_details', 'arguments': {'order_id': 1}},
+            ],
+        }
+        if not options['response_cache']:
+            settings.CHATBOT_LLM['RESPONSE_CACHE_TTL'] = 0
+
+        # One user per session, so per-user rate limits apply as they would in production
+        sessions = []
+        for i in range(options['sessions']):
+            user, _ = User.objects.get_or_create(email=LOADTEST_EMAIL.format(i))
+            sessions.append((ChatbotSession.objects.create(user=user), str(AccessToken.for_user(user))))
+        messages = options['message'] or ['hello there', 'show my cart', 'where is my order', 'phones under 15000']
+        try:
+            results = asyncio.run(self.run(sessions, messages, options['turns'], options['stream']))
+        finally:
+            if not options['keep']:
+                ChatbotSession.objects.filter(pk__in=[s.pk for s, _ in sessions]).delete()
+        self.report(*results)
+
+    async def run(self, sessions, messages, turns, stream):
+        application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+        latencies, ttfbs, errors = [], [], []
+
+        async def session(chat_session, token):
+            communicator = WebsocketCommunicator(
+                application,
+                f'/ws/chatbot/message/{chat_session.session_id}/',
+                headers=[(b'authorization', f'Bearer {token}'.encode())],
+            )
+            connected, _ = await communicator.connect(timeout=30)
+            if not connected:
+                errors.append('connect refused')
+                return
+            try:
+                for turn in range(turns):
+                    start = time.perf_counter()
+                    await communicator.send_to(text_data=json.dumps({
+                        'message': messages[turn % len(messages)],
+                        'stream': stream,
+                    }))
+                    first_byte = None
+                    while True:
+                        frame = json.loads(await communicator.receive_from(timeout=120))
+                        if frame.get('type') == 'busy':
+                            errors.append(f"rejected: {frame['reason']}")
+                            break
+                        if not frame.get('isBot') and 'type' not in frame:
+                            continue  # echo of our own message
+                        if first_byte is None:
+                            first_byte = time.perf_counter() - start
+                        if frame.get('type') in (None, 'end'):
+                            latencies.append(time.perf_counter() - start)
+                            ttfbs.append(first_byte)
+                            break
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                await communicator.disconnect()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(session(s, token) for s, token in sessions))
+        return latencies, ttfbs, errors, time.perf_counter() - start
+
+    def report(self, latencies, ttfbs, errors, elapsed):
+        self.stdout.write(f'{len(latencies)} turns in {elapsed:.2f}s, {len(latencies) / elapsed:.1f} messages/s, {len(errors)} errors')
+        for label, values in (('turn latency', latencies), ('time to first byte', ttfbs)):
+            self.stdout.write(
+                f'{label:>20}: p50 {percentile(values, 50) * 1000:.0f}ms  '
+                f'p95 {percentile(values, 95) * 1000:.0f}ms  p99 {percentile(values, 99) * 1000:.0f}ms'
+            )
+        for error in sorted(set(errors))[:5]:
+            self.stderr.write(error)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from chatbot.management.commands.chatbot_loadtest import percentile
+from chatbot.semantic import semantic_index
+from products.models import Product
+
+SAMPLE_QUERIES = ['something for gaming', 'gift for a runner', 'noise cancelling headphones for travel',
+                  'cheap phone with a good camera', 'warm winter jacket', 'laptop for students']
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the local semantic product index from scratch (needed after bulk_create, '
+        'QuerySet.update or raw SQL, which skip the save signals), then time some sample queries.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Products read per database round trip')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs of each sample query')
+
+    def handle(self, *args, **options):
+        def documents():
+            return Product.objects.values_list('id', 'name', 'description', 'category__name').iterator(
+                chunk_size=options['chunk_size'],
+            )
+
+        start = time.perf_counter()
+        written = semantic_index.build(documents, Product.objects.count())
+        self.stdout.write(f'Indexed {written} products in {time.perf_counter() - start:.1f}s')
+
+        timings = []
+        for query in SAMPLE_QUERIES:
+            for _ in range(options['repeat']):
+                start = time.perf_counter()
+                semantic_index.search(query, k=10)
+                timings.append(time.perf_counter() - start)
+        self.stdout.write(
+            f'Search: {len(timings)} queries, p50 {percentile(timings, 50) * 1000:.1f}ms  '
+            f'p95 {percentile(timings, 95) * 1000:.1f}ms  max {max(timings) * 1000:.1f}ms'
+        )
@@ -0,0 +1,136 @@
+import json
+import random
+import re
+import time
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from chatbot.intent import INTENTS, IntentClassifier
+from chatbot.llm import complete_message
+from chatbot.models import ChatMessage
+from products.models import Category
+
+# Weak labels for stored messages; the first matching rule wins, anything unmatched is 'other'
+LABEL_RULES = [
+    ('show_cart', re.compile(r'\b(my )?(cart|basket|bag)\b', re.I)),
+    ('order_status', re.compile(r'\b(order|orders|track|tracking|delivery|shipped|shipment)\b', re.I)),
+    ('search_product', re.compile(r'\b(show|find|search|looking for|want|need|buy|cheap|under|below|less than|budget|price)\b', re.I)),
+    ('greeting', re.compile(r'^\s*(hi|hello|hey|hiya|good (morning|afternoon|evening)|thanks|thank you)\b', re.I)),
+]
+
+SEED_TEMPLATES = {
+    'search_product': [
+        'show me {category} under {price}', '{category} below {price}', 'i want to buy {category}',
+        'find {category} within {price} rupees', 'any {category} under {price}k', 'cheap {category}',
+        'search {category} less than {price}', 'looking for {category} with a budget of {price}',
+        'do you have {category}', '{category} under rs {price}', 'best {category} under {price}',
+    ],
+    'show_cart': [
+        'show my cart', "what's in my cart", 'view cart', 'cart total', 'open my basket',
+        'what did i add to my cart', 'how many items are in my cart',
+    ],
+    'order_status': [
+        'where is my order', 'track order {number}', 'order status', 'when will my order arrive',
+        'has my order {number} shipped', 'show my orders', 'delivery status of my last order',
+    ],
+    'greeting': ['hi', 'hello', 'hey there', 'good morning', 'thanks', 'thank you so much', 'hello, who are you'],
+    'other': [
+        'what is your return policy', 'how do i reset my password', 'tell me a joke',
+        'compare {category} and {category2}', 'is {category} waterproof', 'can i pay with cash on delivery',
+        'talk to a human', 'which one would you recommend for gaming', 'why was i charged twice',
+    ],
+}
+FALLBACK_CATEGORIES = ['phones', 'laptops', 'shoes', 'shirts', 'headphones', 'watches', 'books']
+
+LLM_LABEL_PROMPT = (
+    "Classify the shopper's message into exactly one intent from this list: {intents}. "
+    "Respond ONLY with JSON like {{\"intent\": \"search_product\"}}.\n\nMessage: '{message}'"
+)
+
+
+def rule_label(text):
+    for intent, pattern in LABEL_RULES:
+        if pattern.search(text):
+            return intent
+    return 'other'
+
+
+class Command(BaseCommand):
+    help = (
+        'Train the local intent classifier used by the REST chat fast path on stored user '
+        'messages (weakly labelled by rules, or by the LLM with --llm-labels) plus seed templates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=str(settings.CHATBOT['INTENT_MODEL_PATH']), help='Where to write the model')
+        parser.add_argument('--limit', type=int, default=50000, help='Most recent user messages to train on')
+        parser.add_argument('--llm-labels', action='store_true', help='Label stored messages with the LLM instead of rules')
+        parser.add_argument('--seed-copies', type=int, default=20, help='Samples generated per seed template')
+        parser.add_argument('--dim', type=int, default=2 ** 16, help='Hashed feature buckets')
+        parser.add_argument('--epochs', type=int, default=30)
+        parser.add_argument('--holdout', type=float, default=0.2, help='Fraction kept aside for evaluation')
+
+    def handle(self, *args, **options):
+        messages = list(
+            ChatMessage.objects.filter(message_type='user')
+            .order_by('-timestamp')
+            .values_list('content', flat=True)[:options['limit']]
+        )
+        label = self.llm_label if options['llm_labels'] else rule_label
+        examples = [(text, label(text)) for text in messages]
+        examples += self.seed_examples(options['seed_copies'])
+        random.Random(0).shuffle(examples)
+
+        split = int(len(examples) * (1 - options['holdout']))
+        train, test = examples[:split], examples[split:]
+        start = time.perf_counter()
+        classifier = IntentClassifier(INTENTS, dim=options['dim']).fit(
+            [text for text, _ in train], [intent for _, intent in train], epochs=options['epochs'],
+        )
+        self.stdout.write(f'Trained on {len(train)} examples ({len(messages)} stored messages) in {time.perf_counter() - start:.1f}s')
+        self.report(classifier, test)
+        classifier.save(options['output'])
+        self.stdout.write(self.style.SUCCESS(f"Model written to {options['output']}"))
+
+    def seed_examples(self, copies):
+        categories = list(Category.objects.filter(is_active=True).values_list('name', flat=True)) or FALLBACK_CATEGORIES
+        rng = random.Random(0)
+        examples = []
+        for intent, templates in SEED_TEMPLATES.items():
+            for template in templates:
+                for _ in range(copies if '{' in template else max(copies // 4, 1)):
+                    text = template.format(
+                        category=rng.choice(categories).lower(),
+                        category2=rng.choice(categories).lower(),
+                        price=rng.choice([5, 10, 15, 20, 25, 50, 100, 500, 999, 1500, 15000, 20000]),
+                        number=rng.randint(1, 99999),
+                    )
+                    examples.append((text, intent))
+        return examples
+
+    def llm_label(self, text):
+        try:
+            response = complete_message(
+                [{"role": "user", "content": LLM_LABEL_PROMPT.format(intents=', '.join(INTENTS), message=text)}],
+                temperature=0.0,
+            )
+            intent = json.loads(response.content.strip()).get('intent')
+        except Exception as e:
+            self.stderr.write(f'Could not label {text!r}: {e}')
+            intent = None
+        return intent if intent in INTENTS else rule_label(text)
+
+    def report(self, classifier, test):
+        if not test:
+            return
+        predictions = [classifier.predict(text) for text, _ in test]
+        correct = np.array([predicted == intent for (predicted, _), (_, intent) in zip(predictions, test)])
+        confident = np.array([confidence >= settings.CHATBOT['INTENT_CONFIDENCE'] for _, confidence in predictions])
+        self.stdout.write(f'Holdout accuracy: {correct.mean():.3f} on {len(test)} examples')
+        if confident.any():
+            self.stdout.write(
+                f"At confidence >= {settings.CHATBOT['INTENT_CONFIDENCE']}: "
+                f'{confident.mean():.1%} of messages routed locally, {correct[confident].mean():.3f} precision'
+            )
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-18 16:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbotsession',
+            name='summarized_message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatbotsession',
+            name='summary',
+            field=models.TextField(blank=True),
+        ),
+    ]
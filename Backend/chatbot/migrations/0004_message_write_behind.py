@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-18 16:53
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_session_summary'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='chatmessage',
+            options={'ordering': ['timestamp', 'id']},
+        ),
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
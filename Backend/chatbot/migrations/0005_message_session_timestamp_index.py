@@ -0,0 +1,17 @@
+# Generated by Django 5.2.2 on 2026-10-18 16:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_message_write_behind'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['session', 'timestamp'], name='chatbot_cha_session_488328_idx'),
+        ),
+    ]
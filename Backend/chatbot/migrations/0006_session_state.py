@@ -0,0 +1,23 @@
+# Generated by Django 5.2.2 on 2026-10-18 16:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_message_session_timestamp_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatbotSessionState',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='state', serialize=False, to='chatbot.chatbotsession', to_field='session_id')),
+                ('history', models.JSONField(default=list)),
+                ('version', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
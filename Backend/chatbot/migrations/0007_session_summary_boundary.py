@@ -0,0 +1,55 @@
+# Generated by Django 5.2.2 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+def count_to_boundary(apps, schema_editor):
+    # The old count was a prefix of the session's messages in (timestamp, id) order
+    ChatbotSession = apps.get_model('chatbot', 'ChatbotSession')
+    ChatMessage = apps.get_model('chatbot', 'ChatMessage')
+    for session in ChatbotSession.objects.filter(summarized_message_count__gt=0).iterator():
+        summarized = list(
+            ChatMessage.objects.filter(session_id=session.pk)
+            .order_by('timestamp', 'id')
+            .values_list('timestamp', 'id')[:session.summarized_message_count]
+        )
+        if summarized:
+            timestamp, pk = summarized[-1]
+            ChatbotSession.objects.filter(pk=session.pk).update(summarized_until=timestamp, summarized_until_id=pk)
+
+
+def boundary_to_count(apps, schema_editor):
+    ChatbotSession = apps.get_model('chatbot', 'ChatbotSession')
+    ChatMessage = apps.get_model('chatbot', 'ChatMessage')
+    for session in ChatbotSession.objects.filter(summarized_until__isnull=False).iterator():
+        count = ChatMessage.objects.filter(
+            models.Q(timestamp__lt=session.summarized_until)
+            | models.Q(timestamp=session.summarized_until, id__lte=session.summarized_until_id),
+            session_id=session.pk,
+        ).count()
+        ChatbotSession.objects.filter(pk=session.pk).update(summarized_message_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_session_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbotsession',
+            name='summarized_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatbotsession',
+            name='summarized_until_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(count_to_boundary, boundary_to_count),
+        migrations.RemoveField(
+            model_name='chatbotsession',
+            name='summarized_message_count',
+        ),
+    ]
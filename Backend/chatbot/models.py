@@ -1,5 +1,6 @@
 
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 import secrets
@@ -23,6 +24,11 @@ class ChatbotSession(models.Model):
     started_at = models.DateTimeField(auto_now_add=True)
     last_activity = models.DateTimeField(auto_now=True)
     ended_at = models.DateTimeField(null=True, blank=True)
+    # Rolling summary of the turns that no longer fit in the LLM context window
+    summary = models.TextField(blank=True)
+    # (timestamp, id) of the last message folded into the summary; the messages after it are live history
+    summarized_until = models.DateTimeField(null=True, blank=True)
+    summarized_until_id = models.BigIntegerField(null=True, blank=True)
     
     class Meta:
         ordering = ['-last_activity']
@@ -53,6 +59,15 @@ class ChatbotSession(models.Model):
         """Get the count of messages in this session"""
         return self.messages.count()
 
+    def unsummarized_messages(self):
+        """Messages after the last one folded into the summary, oldest first"""
+        messages = self.messages.order_by('timestamp', 'id')
+        if self.summarized_until is None:
+            return messages
+        return messages.filter(
+            Q(timestamp__gt=self.summarized_until) | Q(timestamp=self.summarized_until, id__gt=self.summarized_until_id)
+        )
+
 
 class ChatMessage(models.Model):
     """
@@ -67,10 +82,30 @@ class ChatMessage(models.Model):
     session = models.ForeignKey(ChatbotSession, on_delete=models.CASCADE, related_name='messages')
     message_type = models.CharField(max_length=10, choices=MESSAGE_TYPE)
     content = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the message is created in memory, not when it is written, so
+    # batched (write-behind) inserts keep their real send time.
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     
     class Meta:
-        ordering = ['timestamp']
+        ordering = ['timestamp', 'id']
+        indexes = [
+            # Latest-N hydration and cursor pagination walk one session by time
+            models.Index(fields=['session', 'timestamp']),
+        ]
     
     def __str__(self):
-        return f"{self.get_message_type_display()} message in {self.session}"
\ No newline at end of file
+        return f"{self.get_message_type_display()} message in {self.session}"
+
+class ChatbotSessionState(models.Model):
+    """
+    LLM conversation state of a session (including tool calls and results),
+    shared by every worker when the database session state backend is used.
+    ``version`` is bumped on each save for optimistic concurrency control.
+    """
+    session = models.OneToOneField(ChatbotSession, to_field='session_id', on_delete=models.CASCADE, primary_key=True, related_name='state')
+    history = models.JSONField(default=list)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"State of {self.session_id} (v{self.version})"
\ No newline at end of file
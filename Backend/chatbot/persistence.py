@@ -0,0 +1,86 @@
+import asyncio
+import atexit
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ChatMessage
+
+
+class MessageWriteBuffer:
+    """
+    Per-worker write-behind buffer for ``ChatMessage`` rows.
+
+    Messages are collected in memory and written with one ``bulk_create`` when
+    ``max_batch`` rows are pending or ``max_delay`` seconds after the first
+    one arrived, whichever comes first.  Batches are handed to the single
+    thread-sensitive DB thread in the order they were taken, so turn order is
+    preserved; timestamps are taken when the message is buffered.
+    """
+
+    def __init__(self, max_batch, max_delay):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending = []
+        self.flushes = self.written = self.failed = 0
+        self._lock = threading.Lock()
+        self._timer = None
+        self._tasks = set()
+
+    def add(self, session, message_type, content):
+        """Buffer a message; must be called from the event loop"""
+        with self._lock:
+            self.pending.append(ChatMessage(session=session, message_type=message_type, content=content, timestamp=timezone.now()))
+            size = len(self.pending)
+        loop = asyncio.get_running_loop()
+        if size >= self.max_batch:
+            self._spawn_flush(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_delay, self._spawn_flush, loop)
+
+    async def flush(self):
+        """Write everything buffered so far"""
+        batch = self._take()
+        if batch:
+            await database_sync_to_async(self._write)(batch)
+
+    def flush_sync(self):
+        """Blocking flush for process shutdown"""
+        self._write(self._take())
+
+    def stats(self):
+        return {'pending': len(self.pending), 'flushes': self.flushes, 'written': self.written, 'failed': self.failed}
+
+    def _spawn_flush(self, loop):
+        task = loop.create_task(self.flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _take(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            batch, self.pending = self.pending, []
+        return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            ChatMessage.objects.bulk_create(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Error writing {len(batch)} chat messages: {e}")
+        else:
+            self.flushes += 1
+            self.written += len(batch)
+
+
+message_buffer = MessageWriteBuffer(
+    max_batch=settings.CHATBOT['MESSAGE_BATCH_SIZE'],
+    max_delay=settings.CHATBOT['MESSAGE_FLUSH_INTERVAL'],
+)
+atexit.register(message_buffer.flush_sync)
@@ -0,0 +1,50 @@
+"""
+One-shot replies for the REST chat endpoint.
+
+``tool_reply`` sends the message with the websocket consumer's tool
+definitions in a single completion. If the model answers directly that is
+the reply; if it calls tools (a product search, the cart, an order) they run
+through the shared ``ToolRegistry`` and one follow-up completion writes the
+reply. That is at most two LLM calls, where the old intent-JSON-then-summary
+flow always needed two. The follow-up streams through ``on_delta``.
+"""
+import asyncio
+
+from .compaction import compact_tool_result, compaction_stats
+from .ecommerce_tools import registry, tools
+from .history import SYSTEM_PROMPT
+from .llm import acomplete_message
+
+
+async def tool_reply(query, user_id, on_delta=None):
+    """Return ``{"message": ..., "data": ...}``, where data is the page of product search results, if any"""
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": query},
+    ]
+    message = await acomplete_message(
+        messages,
+        on_delta=on_delta,
+        tools=tools,
+        tool_choice="auto",
+        temperature=0.3,
+        top_p=1.0,
+    )
+    if not message.tool_calls:
+        return {"message": message.content, "data": None}
+
+    results = await asyncio.gather(*(registry.run(tool_call, user_id) for tool_call in message.tool_calls))
+    messages.append(message.model_dump(include={"role", "content", "tool_calls"}, exclude_none=True))
+    data = None
+    saved_tokens = 0
+    for tool_call, result in zip(message.tool_calls, results):
+        # The model gets the compact projection; the client gets the full result as data
+        content, saved = compact_tool_result(tool_call.function.name, result)
+        saved_tokens += saved
+        messages.append({"role": "tool", "tool_call_id": tool_call.id, "content": content})
+        if tool_call.function.name == "search_products" and isinstance(result, dict):
+            data = result
+    compaction_stats.record_turn(saved_tokens, len(results))
+
+    followup = await acomplete_message(messages, on_delta=on_delta, temperature=0.5, top_p=1.0)
+    return {"message": followup.content, "data": data}
@@ -0,0 +1,44 @@
+"""
+Cache of LLM replies keyed on the normalized prompt.
+
+Canned questions ("show my cart", "phones under 15000") produce the same
+prompt over and over; their completions are answered from memory instead of
+paying another upstream round-trip.  Prompts that carry tool results depend
+on the user's cart, orders or the live catalog and always bypass the cache.
+"""
+import hashlib
+import json
+import re
+
+from django.conf import settings
+
+from .cache import LRUCache
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?]+$")
+
+
+def normalize_content(text):
+    """Case-fold, collapse whitespace and drop trailing punctuation"""
+    return _TRAILING_PUNCTUATION.sub("", " ".join((text or "").lower().split()))
+
+
+def is_cacheable(messages):
+    return not any(m["role"] in ("tool", "function") for m in messages)
+
+
+def cache_key(messages, params):
+    """Hash of the normalized message list plus every completion parameter (model, temperature, tools...)"""
+    payload = {
+        "messages": [
+            {"role": m["role"], "content": normalize_content(m.get("content")), "tool_calls": m.get("tool_calls")}
+            for m in messages
+        ],
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+response_cache = LRUCache(
+    max_entries=settings.CHATBOT_LLM['RESPONSE_CACHE_MAX_ENTRIES'],
+    ttl=settings.CHATBOT_LLM['RESPONSE_CACHE_TTL'],
+)
@@ -0,0 +1,204 @@
+"""
+Admission control in front of chatbot LLM turns.
+
+Every turn that may call the LLM (a websocket message, a REST chat POST)
+first takes a slot from the worker's ``LLMScheduler``:
+
+- a global cap bounds how many turns, and so LLM calls, run at once;
+- a per-user token bucket rejects users who send faster than their rate;
+- turns over the cap wait in per-user queues served round-robin, so one
+  chatty user cannot starve everyone else;
+- once the queues are full, or a turn has waited too long, it is rejected
+  straight away with ``SchedulerBusy`` instead of piling up.
+
+The scheduler is thread-safe and can be used from async code (``slot``) and
+from synchronous views (``sync_slot``) at the same time.
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+from .cache import LRUCache
+
+
+class SchedulerBusy(Exception):
+    def __init__(self, reason, retry_after=None):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Consume a token; return 0 on success or the seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class _Waiter:
+    def __init__(self):
+        self.state = 'waiting'
+
+    def grant(self):
+        self.state = 'granted'
+
+
+class _AsyncWaiter(_Waiter):
+    def __init__(self):
+        super().__init__()
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def grant(self):
+        super().grant()
+        # The slot may be released from another thread or event loop
+        self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class _SyncWaiter(_Waiter):
+    def __init__(self):
+        super().__init__()
+        self.event = threading.Event()
+
+    def grant(self):
+        super().grant()
+        self.event.set()
+
+
+class LLMScheduler:
+    def __init__(self, max_concurrency, max_queue, queue_timeout, user_rate, user_burst):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.active = self.queued = 0
+        self.admitted = self.rate_limited = self.rejected = self.timed_out = 0
+        self._queues = OrderedDict()  # user -> deque of waiters, in round-robin order
+        self._buckets = LRUCache(max_entries=10000)
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def slot(self, user):
+        waiter = _AsyncWaiter()
+        if not self._admit(user, waiter):
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.queue_timeout)
+            except asyncio.TimeoutError:
+                # Unless the slot was granted just as the wait ran out
+                if self._abandon(user, waiter):
+                    self.timed_out += 1
+                    raise SchedulerBusy('timeout', self.queue_timeout)
+            except asyncio.CancelledError:
+                if not self._abandon(user, waiter):
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextmanager
+    def sync_slot(self, user):
+        waiter = _SyncWaiter()
+        if not self._admit(user, waiter) and not waiter.event.wait(self.queue_timeout):
+            if self._abandon(user, waiter):
+                self.timed_out += 1
+                raise SchedulerBusy('timeout', self.queue_timeout)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'queued': self.queued,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rate_limited': self.rate_limited,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+        }
+
+    def _admit(self, user, waiter):
+        """Take a slot now (True), queue the waiter (False) or raise SchedulerBusy"""
+        with self._lock:
+            bucket = self._buckets.get(user)
+            if bucket is None:
+                bucket = TokenBucket(self.user_rate, self.user_burst)
+                self._buckets.set(user, bucket)
+            retry_after = bucket.take()
+            if retry_after:
+                self.rate_limited += 1
+                raise SchedulerBusy('rate_limited', retry_after)
+            if self.active < self.max_concurrency and not self.queued:
+                self.active += 1
+                self.admitted += 1
+                return True
+            if self.queued >= self.max_queue:
+                self.rejected += 1
+                raise SchedulerBusy('busy')
+            self._queues.setdefault(user, deque()).append(waiter)
+            self.queued += 1
+            return False
+
+    def _abandon(self, user, waiter):
+        """
+        Withdraw a waiter that gave up. Returns False if it had already been
+        granted a slot, which the caller then owns.
+        """
+        with self._lock:
+            if waiter.state == 'waiting':
+                waiter.state = 'abandoned'
+                self._queues[user].remove(waiter)
+                if not self._queues[user]:
+                    del self._queues[user]
+                self.queued -= 1
+                return True
+            return False
+
+    def _release(self):
+        with self._lock:
+            # Hand the slot straight to the next user in round-robin order
+            if self._queues:
+                user, waiters = next(iter(self._queues.items()))
+                waiter = waiters.popleft()
+                self.queued -= 1
+                if waiters:
+                    self._queues.move_to_end(user)
+                else:
+                    del self._queues[user]
+                self.admitted += 1
+                waiter.grant()
+            else:
+                self.active -= 1
+
+
+llm_scheduler = LLMScheduler(
+    max_concurrency=settings.CHATBOT['LLM_MAX_CONCURRENCY'],
+    max_queue=settings.CHATBOT['LLM_MAX_QUEUE'],
+    queue_timeout=settings.CHATBOT['LLM_QUEUE_TIMEOUT'],
+    user_rate=settings.CHATBOT['USER_TURN_RATE'],
+    user_burst=settings.CHATBOT['USER_TURN_BURST'],
+)
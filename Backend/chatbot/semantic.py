@@ -0,0 +1,372 @@
+"""
+Local semantic product search.
+
+Products are embedded on the CPU without any model download: name,
+description and category are turned into TF-IDF weighted hashed features
+(words, word pairs and character 4-grams, so "gaming" also matches "game")
+and projected to ``SEMANTIC_DIM`` dimensions with a fixed random sign
+matrix, then L2-normalized.
+
+The vectors live in a memory-mapped float32 matrix under
+``CHATBOT['SEMANTIC_INDEX_DIR']``, shared by every worker through the page
+cache. Search is brute force: one dot product per product in fixed-size
+chunks, keeping a running top-k. That takes milliseconds even for a large
+catalogue.
+
+``manage.py rebuild_semantic_index`` builds the index (and the IDF table)
+from scratch. After that, Product save and delete signals update single
+rows in place. Writers take a file lock. Readers reopen the files when
+``meta.json`` changes.
+"""
+import json
+import os
+import re
+import threading
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+from django.conf import settings
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from products.models import Product
+
+FEATURE_BUCKETS = 2 ** 16
+PROJECTION_SEED = 20240611
+CHUNK_ROWS = 65536
+# Random projection leaves unrelated products around 0.1-0.2 cosine similarity
+MIN_SCORE = 0.25
+# Nearest neighbours fetched per requested row when category or price filters may drop some
+FILTER_OVERSAMPLE = 4
+# Field weights in a product document
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+STOP_WORDS = frozenset(
+    "a an and any are as at be but by for from has have i in is it me my of on or some something "
+    "that the this to under below with want need looking show find".split()
+)
+
+_WORD_RE = re.compile(r"[a-z]+|[0-9]+")
+
+
+def features(text):
+    """Hashed feature buckets of ``text``, one entry per occurrence"""
+    words = [w for w in _WORD_RE.findall(text.lower()) if w not in STOP_WORDS]
+    grams = [f"w:{w}" for w in words]
+    grams += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f"^{word}$"
+        grams += [f"c:{padded[i:i + 4]}" for i in range(max(len(padded) - 3, 1))]
+    return np.fromiter((zlib.crc32(g.encode()) % FEATURE_BUCKETS for g in grams), dtype=np.int64, count=len(grams))
+
+
+def document_features(name, description, category):
+    """``(buckets, weights)`` for a product, with the name and category counting more than the description"""
+    parts = [(features(text or ""), weight) for text, weight in (
+        (name, FIELD_WEIGHTS["name"]), (category, FIELD_WEIGHTS["category"]), (description, FIELD_WEIGHTS["description"]),
+    )]
+    buckets = np.concatenate([b for b, _ in parts])
+    weights = np.concatenate([np.full(len(b), w, dtype=np.float32) for b, w in parts])
+    return buckets, weights
+
+
+_projections = {}
+
+
+def projection(dim):
+    """The fixed random +-1 projection matrix (8MB of int8 at 128 dimensions)"""
+    if dim not in _projections:
+        rng = np.random.default_rng(PROJECTION_SEED)
+        _projections[dim] = rng.integers(0, 2, size=(FEATURE_BUCKETS, dim), dtype=np.int8) * 2 - 1
+    return _projections[dim]
+
+
+class Embedder:
+    def __init__(self, dim, idf=None):
+        self.dim = dim
+        self.idf = idf if idf is not None else np.ones(FEATURE_BUCKETS, dtype=np.float32)
+        self.projection = projection(dim)
+
+    def embed(self, buckets, weights=None):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        if len(buckets):
+            unique, inverse = np.unique(buckets, return_inverse=True)
+            tf = np.bincount(inverse, weights=weights).astype(np.float32)
+            tfidf = np.log1p(tf) * self.idf[unique]
+            vector = tfidf @ self.projection[unique].astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_product(self, name, description, category):
+        return self.embed(*document_features(name, description, category))
+
+    def embed_query(self, text):
+        return self.embed(features(text))
+
+
+def compute_idf(document_buckets, count):
+    """Smoothed IDF per feature bucket from an iterable of per-document bucket arrays"""
+    df = np.zeros(FEATURE_BUCKETS, dtype=np.int64)
+    for buckets in document_buckets:
+        df[np.unique(buckets)] += 1
+    return (np.log((1 + count) / (1 + df)) + 1).astype(np.float32)
+
+
+def lock_exclusive(lock_file):
+    """Block until this process holds the lock on ``lock_file`` (imported here: fcntl is POSIX-only)"""
+    if os.name == "nt":
+        import msvcrt
+
+        lock_file.seek(0)
+        while True:
+            try:
+                # LK_LOCK gives up after ten one-second retries
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    import fcntl
+
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+
+def unlock(lock_file):
+    if os.name == "nt":
+        import msvcrt
+
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+        return
+    import fcntl
+
+    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class SemanticIndex:
+    """
+    Files in ``path``: ``vectors.npy`` (capacity x dim float32), ``ids.npy``
+    (product id per row, -1 for a free or deleted row), ``idf.npy`` and
+    ``meta.json`` with the number of rows in use.
+    """
+
+    def __init__(self, path, dim):
+        self.path = str(path)
+        self.dim = dim
+        self.vectors = self.ids = self.embedder = None
+        self.count = 0
+        self.loaded_mtime = self.idf_version = None
+        self.updates = self.searches = 0
+        # Reentrant: writers reopen the index while holding it
+        self._lock = threading.RLock()
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    @contextmanager
+    def write_lock(self):
+        """Serialize writers across threads and worker processes"""
+        with self._lock, open(self.file("index.lock"), "a+") as lock_file:
+            lock_exclusive(lock_file)
+            try:
+                yield
+            finally:
+                unlock(lock_file)
+
+    def available(self):
+        """Open or reopen the index if it was (re)written; False if it has not been built"""
+        try:
+            mtime = os.stat(self.file("meta.json")).st_mtime_ns
+        except OSError:
+            return False
+        if mtime != self.loaded_mtime:
+            with self._lock:
+                if mtime != self.loaded_mtime:
+                    self._open(mtime)
+        return True
+
+    def _open(self, mtime):
+        with open(self.file("meta.json")) as f:
+            meta = json.load(f)
+        if self.embedder is None or meta["idf_version"] != self.idf_version:
+            self.embedder = Embedder(meta["dim"], np.load(self.file("idf.npy")))
+            self.idf_version = meta["idf_version"]
+        self.vectors = np.load(self.file("vectors.npy"), mmap_mode="r+")
+        self.ids = np.load(self.file("ids.npy"), mmap_mode="r+")
+        self.count = meta["count"]
+        self.loaded_mtime = mtime
+
+    def _row(self, pk):
+        """
+        Row holding ``pk``, or None. A vectorized scan of the ids (under a
+        millisecond at 1M rows) rather than an id map that every worker would
+        have to rebuild or keep in step with the others' writes.
+        """
+        rows = np.flatnonzero(self.ids[:self.count] == pk)
+        return int(rows[0]) if len(rows) else None
+
+    def _write_meta(self):
+        meta = {"count": self.count, "dim": self.dim, "idf_version": self.idf_version}
+        tmp = self.file("meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, self.file("meta.json"))
+
+    def build(self, documents, count):
+        """
+        Write a fresh index from ``documents``, a callable returning an iterator of
+        ``(id, name, description, category)``; it is read twice, for the IDF and the vectors.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with self.write_lock():
+            idf = compute_idf((document_features(n, d, c)[0] for _, n, d, c in documents()), count)
+            embedder = Embedder(self.dim, idf)
+            capacity = max(count * 5 // 4, 1024)
+            tmp_vectors, tmp_ids = self.file("vectors.tmp.npy"), self.file("ids.tmp.npy")
+            vectors = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32, shape=(capacity, self.dim))
+            ids = np.lib.format.open_memmap(tmp_ids, mode="w+", dtype=np.int64, shape=(capacity,))
+            ids[:] = -1
+            written = 0
+            for pk, name, description, category in documents():
+                if written == capacity:
+                    break
+                vectors[written] = embedder.embed_product(name, description, category)
+                ids[written] = pk
+                written += 1
+            vectors.flush()
+            ids.flush()
+            del vectors, ids
+            np.save(self.file("idf.npy"), idf)
+            os.replace(tmp_vectors, self.file("vectors.npy"))
+            os.replace(tmp_ids, self.file("ids.npy"))
+            self.count = written
+            self.embedder = embedder
+            self.idf_version = os.urandom(8).hex()
+            self._write_meta()
+        return written
+
+    def upsert(self, pk, name, description, category):
+        if not self.available():
+            return
+        with self.write_lock():
+            # Another worker may have appended rows since this one last looked
+            self.loaded_mtime = None
+            self.available()
+            vector = self.embedder.embed_product(name, description, category)
+            row = self._row(pk)
+            if row is None:
+                if self.count == len(self.ids):
+                    self._grow()
+                row = self.count
+                self.count += 1
+            self.vectors[row] = vector
+            self.ids[row] = pk
+            self.vectors.flush()
+            self.ids.flush()
+            self.updates += 1
+            self._write_meta()
+
+    def remove(self, pk):
+        if not self.available():
+            return
+        with self.write_lock():
+            self.loaded_mtime = None
+            self.available()
+            row = self._row(pk)
+            if row is not None:
+                self.ids[row] = -1
+                self.ids.flush()
+                self.updates += 1
+                self._write_meta()
+
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        for name, dtype, shape, fill in (
+            ("vectors", np.float32, (capacity, self.dim), 0),
+            ("ids", np.int64, (capacity,), -1),
+        ):
+            old = getattr(self, name)
+            tmp = self.file(f"{name}.tmp.npy")
+            grown = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+            grown[:len(old)] = old
+            grown[len(old):] = fill
+            grown.flush()
+            del grown
+            os.replace(tmp, self.file(f"{name}.npy"))
+        self.vectors = np.load(self.file("vectors.npy"), mmap_mode="r+")
+        self.ids = np.load(self.file("ids.npy"), mmap_mode="r+")
+
+    def search(self, text, k=10):
+        """``[(product_id, score), ...]`` of the ``k`` nearest products, best first"""
+        if not self.available():
+            return []
+        self.searches += 1
+        vectors, ids, count = self.vectors, self.ids, self.count
+        query = self.embedder.embed_query(text)
+        if not query.any():
+            return []
+        best_scores = np.empty(0, dtype=np.float32)
+        best_ids = np.empty(0, dtype=np.int64)
+        for start in range(0, count, CHUNK_ROWS):
+            scores = vectors[start:start + CHUNK_ROWS] @ query
+            chunk_ids = ids[start:start + CHUNK_ROWS]
+            scores[chunk_ids < 0] = -np.inf
+            if len(scores) > k:
+                top = np.argpartition(scores, -k)[-k:]
+                scores, chunk_ids = scores[top], chunk_ids[top]
+            best_scores = np.concatenate([best_scores, scores])
+            best_ids = np.concatenate([best_ids, chunk_ids])
+            if len(best_scores) > k:
+                top = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_ids = best_scores[top], best_ids[top]
+        order = np.argsort(-best_scores)
+        return [(int(best_ids[i]), float(best_scores[i])) for i in order if np.isfinite(best_scores[i])]
+
+    def stats(self):
+        return {"built": self.loaded_mtime is not None, "rows": self.count, "updates": self.updates, "searches": self.searches}
+
+
+semantic_index = SemanticIndex(settings.CHATBOT["SEMANTIC_INDEX_DIR"], settings.CHATBOT["SEMANTIC_DIM"])
+
+
+def search_products(text, category=None, price_limit=None, limit=10, offset=0):
+    """
+    Rows of ``id``, ``name``, ``current_price`` and ``image`` for the active
+    products closest to ``text``, best first; the filters are applied to the
+    nearest neighbours in one query. Returns None if the index has not been built.
+    """
+    if not semantic_index.available():
+        return None
+    wanted = offset + limit
+    if category or price_limit is not None:
+        wanted *= FILTER_OVERSAMPLE
+    hits = [(pk, score) for pk, score in semantic_index.search(text, k=wanted) if score >= MIN_SCORE]
+    products = Product.objects.filter(id__in=[pk for pk, _ in hits], is_active=True).annotate(
+        current_price=Coalesce("discount_price", "price"),
+    )
+    if category:
+        products = products.filter(category__name__icontains=category)
+    if price_limit is not None:
+        products = products.filter(current_price__lte=price_limit)
+    rows = {row["id"]: row for row in products.values("id", "name", "current_price", "image")}
+    ranked = [rows[pk] for pk, _ in hits if pk in rows]
+    return ranked[offset:offset + limit]
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    try:
+        semantic_index.upsert(instance.pk, instance.name, instance.description, instance.category.name)
+    except Exception as e:
+        # The next rebuild picks the product up; a save must not fail over the index
+        print(f"Error indexing product {instance.pk}: {e}")
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    try:
+        semantic_index.remove(instance.pk)
+    except Exception as e:
+        print(f"Error removing product {instance.pk} from the semantic index: {e}")
@@ -0,0 +1,106 @@
+"""
+Conversation state backends.
+
+A session's LLM message list (system prompt, running summary, turns with
+their tool calls and results) is kept in a pluggable backend selected with
+``CHATBOT['SESSION_STATE_BACKEND']``:
+
+- ``InProcessSessionStateBackend`` keeps it in the worker's bounded LRU store.
+  Fast, but a reconnect that lands on another worker rebuilds the history
+  from stored ``ChatMessage`` rows and loses tool results.
+- ``DatabaseSessionStateBackend`` keeps it in the ``ChatbotSessionState``
+  table, shared by every worker and node, so no sticky routing is needed.
+
+Writes use optimistic versioning: ``save`` only succeeds if the stored
+version is still the one that was loaded, otherwise ``ConflictError`` is
+raised and the caller replays its turn on top of the newer state.
+"""
+import threading
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils.module_loading import import_string
+
+from .history import SessionHistoryStore
+from .models import ChatbotSessionState
+
+
+class ConflictError(Exception):
+    """The session state was saved by someone else since it was loaded"""
+
+
+class BaseSessionStateBackend:
+    async def load(self, session_id):
+        """Return ``(history, version)``, or ``None`` if nothing is stored for the session"""
+        raise NotImplementedError
+
+    async def save(self, session_id, history, version):
+        """Store ``history`` if the stored version is still ``version``; return the new version"""
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+
+class InProcessSessionStateBackend(BaseSessionStateBackend):
+    def __init__(self):
+        self.store = SessionHistoryStore(
+            max_sessions=settings.CHATBOT['HISTORY_MAX_SESSIONS'],
+            idle_ttl=settings.CHATBOT['HISTORY_IDLE_TTL'],
+            max_bytes=settings.CHATBOT['HISTORY_MAX_BYTES'],
+        )
+        self.conflicts = 0
+        self._lock = threading.Lock()
+
+    async def load(self, session_id):
+        entry = self.store.get(session_id)
+        if entry is None:
+            return None
+        history, version = entry
+        # Callers mutate their copy during a turn; the stored list only changes on save
+        return list(history), version
+
+    async def save(self, session_id, history, version):
+        with self._lock:
+            entry = self.store.peek(session_id)
+            # An evicted session has nothing newer to conflict with
+            if entry is not None and entry[1] != version:
+                self.conflicts += 1
+                raise ConflictError(session_id)
+            self.store.set(session_id, (history, version + 1))
+        return version + 1
+
+    def stats(self):
+        return {**self.store.stats(), 'conflicts': self.conflicts}
+
+
+class DatabaseSessionStateBackend(BaseSessionStateBackend):
+    def __init__(self):
+        self.loads = self.saves = self.conflicts = 0
+
+    @database_sync_to_async
+    def load(self, session_id):
+        self.loads += 1
+        return ChatbotSessionState.objects.filter(session_id=session_id).values_list('history', 'version').first()
+
+    @database_sync_to_async
+    def save(self, session_id, history, version):
+        if version == 0:
+            try:
+                with transaction.atomic():
+                    ChatbotSessionState.objects.create(session_id=session_id, history=history, version=1)
+            except IntegrityError:
+                self.conflicts += 1
+                raise ConflictError(session_id)
+        elif not ChatbotSessionState.objects.filter(session_id=session_id, version=version).update(history=history, version=version + 1):
+            self.conflicts += 1
+            raise ConflictError(session_id)
+        self.saves += 1
+        return version + 1
+
+    def stats(self):
+        return {'loads': self.loads, 'saves': self.saves, 'conflicts': self.conflicts}
+
+
+session_state = import_string(settings.CHATBOT['SESSION_STATE_BACKEND'])()
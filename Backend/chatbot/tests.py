@@ -1,3 +1,107 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from products.models import Category, Product
+from users.models import User
+
+from .consumers import ChatConsumer
+from .ecommerce_tools import encode_search_cursor
+from .models import ChatbotSession, ChatMessage
+
+
+class ProductSearchCursorTests(TestCase):
+    """Cursors come back from the client, so a tampered one must be rejected, not crash a backend"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='shopper@example.com', password='pass')
+        category = Category.objects.create(name='Phones', slug='phones')
+        for i in range(12):
+            Product.objects.create(name=f'Phone {i}', slug=f'phone-{i}', description='A phone', category=category,
+                                   price=100 + i, stock=1, sku=f'PHONE-{i}')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def search(self, **params):
+        return self.client.get(reverse('chatbot-product-search'), params)
+
+    def test_next_page(self):
+        first = self.search(category='phone', price_limit='150')
+        self.assertEqual(first.status_code, 200)
+        self.assertIsNotNone(first.data['next'])
+        second = self.search(cursor=first.data['next'])
+        self.assertEqual(second.status_code, 200)
+        seen = {p['id'] for p in first.data['products']}
+        self.assertTrue(second.data['products'])
+        self.assertFalse(seen & {p['id'] for p in second.data['products']})
+
+    def test_tampered_cursor(self):
+        for cursor in (
+            encode_search_cursor({'price_limit': 'abc'}, 0),
+            encode_search_cursor({'category': 5}, 0),
+            encode_search_cursor({'keyword': ['phone']}, 0),
+            encode_search_cursor({'category': 'phone'}, -10),
+            encode_search_cursor({'category': 'phone'}, '10'),
+            encode_search_cursor({'category': 'phone'}, True),
+            encode_search_cursor([], 0),
+            'not-a-cursor',
+        ):
+            with self.subTest(cursor=cursor):
+                response = self.search(cursor=cursor)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.data)
+
+
+async def fake_summarize(summary, messages, max_tokens):
+    return " ".join([summary] * bool(summary) + [m["content"] for m in messages])
+
+
+@patch("chatbot.context.summarize", fake_summarize)
+@patch("chatbot.consumers.summarize", fake_summarize)
+@override_settings(CHATBOT={**settings.CHATBOT, "HISTORY_HYDRATE_LIMIT": 4, "CONTEXT_TOKEN_BUDGET": 1})
+class SummaryBoundaryTests(TestCase):
+    """Every stored message ends up either in the summary or in the live history, never both"""
+
+    def setUp(self):
+        self.session = ChatbotSession.objects.create(session_id="boundary")
+        start = timezone.now() - timedelta(hours=1)
+        ChatMessage.objects.bulk_create(
+            ChatMessage(session=self.session, message_type="user" if i % 2 == 0 else "bot", content=f"m{i}",
+                        timestamp=start + timedelta(seconds=i))
+            for i in range(10)
+        )
+
+    def connect(self):
+        consumer = ChatConsumer()
+        consumer.session_id = self.session.session_id
+        consumer.session = self.session
+        consumer.history, consumer.state_version = async_to_sync(consumer.load_state)()
+        return consumer
+
+    def live(self, history):
+        return [m["content"] for m in history if m["role"] != "system"]
+
+    def test_reconnect_after_fold(self):
+        # Messages older than the hydrate limit are folded into the summary on load
+        consumer = self.connect()
+        self.assertEqual(self.live(consumer.history), ["m6", "m7", "m8", "m9"])
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary, "m0 m1 m2 m3 m4 m5")
+
+        # A new turn folds the hydrated messages; only the new one stays live
+        consumer.history.append({"role": "user", "content": "m10"})
+        async_to_sync(consumer.build_prompt)()
+        self.assertEqual(self.live(consumer.history), ["m10"])
+
+        self.session.refresh_from_db()
+        self.assertEqual(self.session.summary, "m0 m1 m2 m3 m4 m5 m6 m7 m8 m9")
+        self.assertEqual(self.live(self.connect().history), [])
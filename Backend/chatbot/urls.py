@@ -8,5 +8,9 @@ router.register('session', views.ChatbotSessionViewSet, basename="session")
 
 urlpatterns = [
     path('session/<str:session_id>/messages', views.ChatMessageView.as_view(), name='session-message'),
+    path('session/<str:session_id>/messages/async', views.AsyncChatMessageView.as_view(), name='session-message-async'),
+    path('session/<str:session_id>/messages/stream', views.ChatStreamView.as_view(), name='session-message-stream'),
+    path('products/search', views.ChatbotProductSearchView.as_view(), name='chatbot-product-search'),
+    path('stats/', views.ChatbotStatsView.as_view(), name='chatbot-stats'),
     path('',include(router.urls))
 ]
@@ -1,22 +1,46 @@
-from django.shortcuts import get_object_or_404
-from decouple import config 
+import asyncio
 import json
-from azure.ai.inference import ChatCompletionsClient
-from azure.ai.inference.models import SystemMessage, UserMessage
-from azure.core.credentials import AzureKeyCredential
+import math
+from contextlib import nullcontext
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework import viewsets, status
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
-from django.utils import timezone
+
+from .catalog import catalog_snapshot
+from .compaction import compaction_stats
+from .ecommerce_tools import registry, search_products, ToolError
+from .intent import intent_router
+from .jwt_middleware import authenticate, verified_tokens, users
+from .llm import complete_message
 from .models import ChatbotSession, ChatMessage
-from products.models import Product
-from products.serializers import ProductSerializer
+from .persistence import message_buffer
+from .replies import tool_reply
+from .response_cache import response_cache
+from .scheduler import llm_scheduler, SchedulerBusy
+from .semantic import semantic_index
 from .serializers import ChatbotSessionSerializer, ChatMessageSerializer, ChatMessageCreateSerializer
+from .session_state import session_state
+
+
 
 
 
 
+def busy_response(error, response_class=Response):
+    """429 for a user over their rate, 503 when the worker's LLM queue is full"""
+    code = status.HTTP_429_TOO_MANY_REQUESTS if error.reason == 'rate_limited' else status.HTTP_503_SERVICE_UNAVAILABLE
+    headers = {'Retry-After': str(math.ceil(error.retry_after))} if error.retry_after else None
+    return response_class({'error': 'Chatbot is busy, please retry shortly', 'reason': error.reason}, status=code, headers=headers)
 
 
 class ChatbotSessionViewSet(viewsets.ModelViewSet):
@@ -67,12 +91,21 @@ class ChatMessageView(APIView):
         if not user_serializer.is_valid():
             return Response({'error': 'Invalid user message', 'details': user_serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
 
-        user_message = user_serializer.save()
-        session.last_activity = timezone.now()
-        session.save()
-
-        # AI Logic & Bot Reply
-        bot_logic = self.get_bot_response(user_message_text)
+        # Confident simple intents are answered locally and need no LLM slot
+        bot_logic = self.get_fast_response(user_message_text)
+        try:
+            with nullcontext() if bot_logic else llm_scheduler.sync_slot(request.user.id):
+                user_message = user_serializer.save()
+                session.last_activity = timezone.now()
+                session.save()
+
+                # AI Logic & Bot Reply
+                if bot_logic is None and settings.CHATBOT['REST_CHAT_MODE'] == 'tools':
+                    bot_logic = self.get_tool_response(user_message_text, request.user.id)
+                elif bot_logic is None:
+                    bot_logic = self.get_bot_response(user_message_text)
+        except SchedulerBusy as e:
+            return busy_response(e)
         bot_text = bot_logic.get("message", "Sorry, I couldn't understand that.")
         bot_data = bot_logic.get("data")
 
@@ -96,7 +129,49 @@ class ChatMessageView(APIView):
         }, status=status.HTTP_201_CREATED)
 
     @staticmethod
-    def get_bot_response(query: str) -> dict:
+    def search_products(params: dict):
+        # Same query and result shape as the chatbot's search_products tool
+        return search_products(params, None)
+
+    @classmethod
+    def get_fast_response(cls, query: str):
+        """
+        Answer a message the local intent classifier is sure about with a DB query
+        and a template reply, or return None to go through the LLM.
+        """
+        try:
+            routed = intent_router.route(query, intents=("search_product", "greeting"))
+        except Exception as e:
+            print(f"Intent classifier error: {e}")
+            return None
+        if routed is None:
+            return None
+        intent, params = routed
+        if intent == "greeting":
+            return {"message": "Hi! I can help you find products, check your cart or track an order.", "data": None}
+
+        products_data = cls.search_products(params)
+        under = f" under {params['price_limit']}" if "price_limit" in params else ""
+        if products_data["products"]:
+            more = " There are more if you'd like to see them." if products_data["next"] else ""
+            message = f"Here are the top {len(products_data['products'])} products in {params['category']}{under}.{more}"
+        else:
+            message = f"Sorry, I couldn't find any products in {params['category']}{under}."
+        return {"message": message, "data": products_data if products_data["products"] else None}
+
+    @staticmethod
+    def get_tool_response(query: str, user_id) -> dict:
+        """One tool-calling completion, the tools it asked for, then one follow-up for the reply"""
+        try:
+            return async_to_sync(tool_reply)(query, user_id)
+        except Exception as e:
+            return {
+                "message": "Something went wrong while processing your request.",
+                "data": f"Error: {str(e)}"
+            }
+
+    @classmethod
+    def get_bot_response(cls, query: str) -> dict:
         """
         -  AI parses the query to structured JSON (intent + parameters)
         -  Perform database logic if applicable
@@ -105,25 +180,24 @@ class ChatMessageView(APIView):
         try:
             # Get intent and parameters
             extract_intent_prompt = [
-                SystemMessage("You are an intent extraction engine. Respond ONLY in JSON."),
-                UserMessage(
+                {"role": "system", "content": "You are an intent extraction engine. Respond ONLY in JSON."},
+                {"role": "user", "content": (
                     f"""Extract 'intent' and optional 'parameters' like category, price_limit, or product_id from the message below.
 
     Message: '{query}'
 
     Respond with only a JSON like:
     {{"intent": "search_product", "parameters": {{"category": "phone", "price_limit": 15000}}}}"""
-                )
+                )}
             ]
 
-            intent_response = client.complete(
-                messages=extract_intent_prompt,
+            intent_response = complete_message(
+                extract_intent_prompt,
                 temperature=0.3,
                 top_p=1.0,
-                model=model
             )
 
-            intent_data = json.loads(intent_response.choices[0].message.content.strip())
+            intent_data = json.loads(intent_response.content.strip())
             intent = intent_data.get("intent")
             params = intent_data.get("parameters", {})
 
@@ -131,39 +205,33 @@ class ChatMessageView(APIView):
 
             # Step 2: Handle actionable intent
             if intent == "search_product":
-                products = Product.objects.all()
-                if "category" in params:
-                    products = products.filter(category__name__icontains=params["category"])
-                if "price_limit" in params:
-                    products = products.filter(price__lte=params["price_limit"])
-                products_data = ProductSerializer(products, many=True).data
+                products_data = cls.search_products(params)
 
             #   generate natural response message based on user query and intent
             summary_prompt = [
-                SystemMessage("You are a helpful assistant that summarizes search results or replies conversationally."),
-                UserMessage(
+                {"role": "system", "content": "You are a helpful assistant that summarizes search results or replies conversationally."},
+                {"role": "user", "content": (
                     f"""User asked: '{query}'
 
     Here is the extracted intent: {intent}
     Parameters: {json.dumps(params)}
-    Search Result: {'Found ' + str(len(products_data)) + ' products' if products_data else 'No products found' if intent == 'search_product' else 'Not applicable'}
+    Search Result: {'Found ' + str(len(products_data['products'])) + ' products' if products_data and products_data['products'] else 'No products found' if intent == 'search_product' else 'Not applicable'}
 
     Now, generate a friendly reply for the user in simple language."""
-                )
+                )}
             ]
 
-            summary_response = client.complete(
-                messages=summary_prompt,
+            summary_response = complete_message(
+                summary_prompt,
                 temperature=0.5,
                 top_p=1.0,
-                model=model
             )
 
-            ai_message = summary_response.choices[0].message.content.strip()
+            ai_message = summary_response.content.strip()
 
             return {
                 "message": ai_message,
-                "data": products_data if products_data else None
+                "data": products_data if products_data and products_data["products"] else None
             }
 
         except Exception as e:
@@ -171,3 +239,169 @@ class ChatMessageView(APIView):
                 "message": "Something went wrong while processing your request.",
                 "data": f"Error: {str(e)}"
             }
+
+
+async def start_chat_turn(request, session_id):
+    """
+    Authenticate the bearer token, load the active session and read the message.
+    Returns ``(user, session, text)``, or an error response.
+    """
+    auth_header = request.headers.get('Authorization', '')
+    user = await authenticate(auth_header.split(' ')[1]) if auth_header.startswith('Bearer ') else None
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided or are invalid.'}, status=status.HTTP_401_UNAUTHORIZED)
+    try:
+        session = await ChatbotSession.objects.aget(session_id=session_id, user=user)
+    except ChatbotSession.DoesNotExist:
+        return JsonResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+    if session.status != 'active':
+        return JsonResponse({'error': 'Session is inactive or completed'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        text = str(json.loads(request.body or b'{}').get('message', '')).strip()
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+    if not text:
+        return JsonResponse({'error': 'Empty message not allowed'}, status=status.HTTP_400_BAD_REQUEST)
+    return user, session, text
+
+
+async def run_chat_turn(user, session, text, on_delta=None):
+    """
+    Async counterpart of ChatMessageView.post: store the user message, get the reply
+    (local fast path or LLM, streamed through ``on_delta``) and store it.
+    Raises SchedulerBusy if the LLM scheduler turns the message away.
+    """
+    bot_logic = await sync_to_async(ChatMessageView.get_fast_response)(text)
+    async with nullcontext() if bot_logic else llm_scheduler.slot(user.id):
+        user_message = await ChatMessage.objects.acreate(session=session, message_type='user', content=text)
+        session.last_activity = timezone.now()
+        await session.asave(update_fields=['last_activity'])
+
+        if bot_logic is not None:
+            if on_delta is not None:
+                await on_delta(bot_logic["message"])
+        elif settings.CHATBOT['REST_CHAT_MODE'] == 'tools':
+            try:
+                bot_logic = await tool_reply(text, user.id, on_delta)
+            except Exception as e:
+                bot_logic = {"message": "Something went wrong while processing your request.", "data": f"Error: {str(e)}"}
+        else:
+            bot_logic = await sync_to_async(ChatMessageView.get_bot_response)(text)
+
+    bot_text = bot_logic.get("message") or "Sorry, I couldn't understand that."
+    bot_message = await ChatMessage.objects.acreate(session=session, message_type='bot', content=bot_text)
+    return {
+        'session_id': session.session_id,
+        'user_message': ChatMessageSerializer(user_message).data,
+        'bot_response': ChatMessageSerializer(bot_message).data,
+        'data': bot_logic.get("data") or None
+    }
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatMessageView(View):
+    """
+    Async variant of ChatMessageView.post. The LLM call awaits the async client
+    and the ORM calls are async, so a slow completion holds no worker thread.
+    """
+    http_method_names = ['post']
+
+    async def post(self, request, session_id):
+        started = await start_chat_turn(request, session_id)
+        if isinstance(started, JsonResponse):
+            return started
+        try:
+            payload = await run_chat_turn(*started)
+        except SchedulerBusy as e:
+            return busy_response(e, JsonResponse)
+        return JsonResponse(payload, status=status.HTTP_201_CREATED)
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class ChatStreamView(View):
+    """
+    Server-Sent Events variant: POST {"message": ...} and read ``delta`` events
+    as the reply is generated, then one ``done`` event with the same payload as
+    ChatMessageView (or a ``busy`` event if the chatbot is overloaded).
+    """
+    http_method_names = ['post']
+
+    async def post(self, request, session_id):
+        started = await start_chat_turn(request, session_id)
+        if isinstance(started, JsonResponse):
+            return started
+        response = StreamingHttpResponse(self.events(*started), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # keep proxies from buffering the stream
+        return response
+
+    async def events(self, user, session, text):
+        queue = asyncio.Queue()
+
+        async def on_delta(delta):
+            queue.put_nowait(sse_event('delta', {'delta': delta}))
+
+        async def turn():
+            try:
+                queue.put_nowait(sse_event('done', await run_chat_turn(user, session, text, on_delta)))
+            except SchedulerBusy as e:
+                queue.put_nowait(sse_event('busy', {'reason': e.reason, 'retryAfter': e.retry_after, 'message': text}))
+            except Exception as e:
+                print(f"Error streaming chat reply: {e}")
+                queue.put_nowait(sse_event('error', {'error': 'Something went wrong while processing your request.'}))
+            finally:
+                queue.put_nowait(None)
+
+        task = asyncio.create_task(turn())
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            # The client went away: stop generating a reply nobody will read
+            task.cancel()
+
+
+class ChatbotProductSearchView(APIView):
+    """
+    Further pages of a chatbot product search: GET ?cursor=<next token from a
+    chat reply's data>, or start a search with category, price_limit and keyword.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        params = {k: v for k, v in request.query_params.items() if k in ('cursor', 'category', 'keyword')}
+        if request.query_params.get('price_limit'):
+            try:
+                params['price_limit'] = float(request.query_params['price_limit'])
+            except ValueError:
+                return Response({'error': 'price_limit must be a number'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(search_products(params, request.user.id))
+        except ToolError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class ChatbotStatsView(APIView):
+    """
+    Per-worker chatbot runtime counters, for sizing caches against worker RAM.
+    Numbers are local to the worker process that serves the request.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            'session_state': session_state.stats(),
+            'tool_cache': registry.cache.stats(),
+            'response_cache': response_cache.stats(),
+            'message_buffer': message_buffer.stats(),
+            'llm_scheduler': llm_scheduler.stats(),
+            'jwt_cache': {'tokens': verified_tokens.stats(), 'users': users.stats()},
+            'intent_router': intent_router.stats(),
+            'catalog_snapshot': catalog_snapshot.stats(),
+            'semantic_index': semantic_index.stats(),
+            'tool_compaction': compaction_stats.stats(),
+        })
@@ -1,5 +1,6 @@
 from pathlib import Path
 from datetime import timedelta
+from decouple import config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -165,3 +166,89 @@ SPECTACULAR_SETTINGS = {
     'SERVE_INCLUDE_SCHEMA': False,
     # OTHER SETTINGS
 }
+
+
+# Chatbot LLM client
+# One pooled keep-alive connection pool is shared per event loop, so every
+# websocket on a worker reuses the same upstream connections.
+CHATBOT_LLM = {
+    # 'chatbot.llm_stub.StubBackend' answers offline with scripted replies (see CHATBOT_LLM['STUB'])
+    'BACKEND': config('CHATBOT_LLM_BACKEND', default='chatbot.llm.OpenAIBackend'),
+    'ENDPOINT': config('CHATBOT_LLM_ENDPOINT', default='https://models.github.ai/inference'),
+    'MODEL': config('CHATBOT_LLM_MODEL', default='openai/gpt-4.1'),
+    'API_KEY': config('GITHUB_TOKEN', default=''),
+    'TIMEOUT': config('CHATBOT_LLM_TIMEOUT', default=60.0, cast=float),  # seconds, per call
+    'CONNECT_TIMEOUT': config('CHATBOT_LLM_CONNECT_TIMEOUT', default=5.0, cast=float),
+    'MAX_RETRIES': config('CHATBOT_LLM_MAX_RETRIES', default=2, cast=int),
+    'MAX_CONNECTIONS': config('CHATBOT_LLM_MAX_CONNECTIONS', default=200, cast=int),
+    'MAX_KEEPALIVE_CONNECTIONS': config('CHATBOT_LLM_MAX_KEEPALIVE_CONNECTIONS', default=50, cast=int),
+    'KEEPALIVE_EXPIRY': 30.0,
+    # Replies keyed on the normalized prompt; 0 disables the cache
+    'RESPONSE_CACHE_TTL': config('CHATBOT_LLM_RESPONSE_CACHE_TTL', default=600, cast=int),  # seconds
+    'RESPONSE_CACHE_MAX_ENTRIES': config('CHATBOT_LLM_RESPONSE_CACHE_MAX_ENTRIES', default=2048, cast=int),
+}
+
+# Chatbot behaviour
+CHATBOT = {
+    # Stream replies as start / delta / end websocket frames unless the
+    # client says otherwise with {"stream": false} on a message.
+    'STREAM_REPLIES': config('CHATBOT_STREAM_REPLIES', default=False, cast=bool),
+    # Turns of a session run one at a time, in order. With this on, a new user
+    # message cancels the reply still being generated (clients can override it
+    # per message with {"supersede": ...}); {"type": "stop"} always does.
+    'CANCEL_SUPERSEDED_TURNS': config('CHATBOT_CANCEL_SUPERSEDED_TURNS', default=False, cast=bool),
+    # Where LLM conversation state lives: per worker (InProcess...) or shared by
+    # every worker and node (chatbot.session_state.DatabaseSessionStateBackend)
+    'SESSION_STATE_BACKEND': config('CHATBOT_SESSION_STATE_BACKEND', default='chatbot.session_state.InProcessSessionStateBackend'),
+    'SESSION_STATE_RETRIES': 3,
+    # Per-worker session history store (LRU with idle expiry and a memory budget)
+    'HISTORY_MAX_SESSIONS': config('CHATBOT_HISTORY_MAX_SESSIONS', default=1000, cast=int),
+    'HISTORY_IDLE_TTL': config('CHATBOT_HISTORY_IDLE_TTL', default=1800, cast=int),  # seconds
+    'HISTORY_MAX_BYTES': config('CHATBOT_HISTORY_MAX_BYTES', default=64 * 1024 * 1024, cast=int),
+    # Stored messages loaded into a history on connect; older ones are paged on demand
+    'HISTORY_HYDRATE_LIMIT': config('CHATBOT_HISTORY_HYDRATE_LIMIT', default=50, cast=int),
+    'HISTORY_PAGE_SIZE': 50,
+    # Prompt tokens sent per completion; older turns are folded into a running summary
+    'CONTEXT_TOKEN_BUDGET': config('CHATBOT_CONTEXT_TOKEN_BUDGET', default=3000, cast=int),
+    'SUMMARY_MAX_TOKENS': config('CHATBOT_SUMMARY_MAX_TOKENS', default=300, cast=int),
+    # Tool calls from one completion run concurrently; the model may chain this many rounds
+    'MAX_TOOL_ROUNDS': config('CHATBOT_MAX_TOOL_ROUNDS', default=3, cast=int),
+    # Tool results go into the prompt as compact per-tool projections of at most this many
+    # rows; payloads of answered turns older than the last TOOL_RESULT_KEEP_TURNS are dropped
+    'TOOL_RESULT_MAX_ROWS': config('CHATBOT_TOOL_RESULT_MAX_ROWS', default=10, cast=int),
+    'TOOL_RESULT_KEEP_TURNS': config('CHATBOT_TOOL_RESULT_KEEP_TURNS', default=1, cast=int),
+    'TOOL_TIMEOUT': config('CHATBOT_TOOL_TIMEOUT', default=10.0, cast=float),  # seconds, per tool call
+    # Admission control for LLM turns: global concurrency cap, bounded fair queue
+    # and a per-user token bucket (turns per second, burst size)
+    'LLM_MAX_CONCURRENCY': config('CHATBOT_LLM_MAX_CONCURRENCY', default=64, cast=int),
+    'LLM_MAX_QUEUE': config('CHATBOT_LLM_MAX_QUEUE', default=256, cast=int),
+    'LLM_QUEUE_TIMEOUT': config('CHATBOT_LLM_QUEUE_TIMEOUT', default=30.0, cast=float),  # seconds
+    'USER_TURN_RATE': config('CHATBOT_USER_TURN_RATE', default=0.5, cast=float),
+    'USER_TURN_BURST': config('CHATBOT_USER_TURN_BURST', default=5, cast=int),
+    # Websocket handshakes: verified JWTs are cached until they expire, resolved users for this long
+    'JWT_CACHE_MAX_ENTRIES': config('CHATBOT_JWT_CACHE_MAX_ENTRIES', default=10000, cast=int),
+    'JWT_USER_CACHE_TTL': config('CHATBOT_JWT_USER_CACHE_TTL', default=300, cast=int),  # seconds
+    # REST chat replies: 'tools' makes one tool-calling completion plus a follow-up
+    # only when a tool ran; 'two_step' is the older intent JSON + summary flow
+    'REST_CHAT_MODE': config('CHATBOT_REST_CHAT_MODE', default='tools'),
+    # Chatbot product search returns compact rows in pages of this size, and
+    # never more than SEARCH_MAX_RESULTS in total however broad the query
+    'SEARCH_PAGE_SIZE': config('CHATBOT_SEARCH_PAGE_SIZE', default=10, cast=int),
+    'SEARCH_MAX_RESULTS': config('CHATBOT_SEARCH_MAX_RESULTS', default=100, cast=int),
+    # Searches without a keyword are answered from a per-worker NumPy snapshot of the
+    # catalogue, refreshed from updated_at deltas and fully rebuilt periodically
+    'CATALOG_SNAPSHOT': config('CHATBOT_CATALOG_SNAPSHOT', default=True, cast=bool),
+    'CATALOG_SNAPSHOT_MAX_STALENESS': config('CHATBOT_CATALOG_SNAPSHOT_MAX_STALENESS', default=5.0, cast=float),  # seconds
+    'CATALOG_SNAPSHOT_REBUILD_INTERVAL': config('CHATBOT_CATALOG_SNAPSHOT_REBUILD_INTERVAL', default=600.0, cast=float),  # seconds
+    # Local semantic product search (manage.py rebuild_semantic_index): hashed TF-IDF
+    # features projected to SEMANTIC_DIM dimensions in a memory-mapped matrix
+    'SEMANTIC_INDEX_DIR': config('CHATBOT_SEMANTIC_INDEX_DIR', default=str(BASE_DIR / 'semantic_index')),
+    'SEMANTIC_DIM': config('CHATBOT_SEMANTIC_DIM', default=128, cast=int),
+    # Local intent classifier for the REST chat endpoint (manage.py train_intent_classifier);
+    # confident predictions are answered from the database without calling the LLM
+    'INTENT_MODEL_PATH': config('CHATBOT_INTENT_MODEL_PATH', default=str(BASE_DIR / 'chatbot_intent.npz')),
+    'INTENT_CONFIDENCE': config('CHATBOT_INTENT_CONFIDENCE', default=0.85, cast=float),
+    # Chat messages are written in batches of up to this many rows, at most this many seconds late
+    'MESSAGE_BATCH_SIZE': config('CHATBOT_MESSAGE_BATCH_SIZE', default=100, cast=int),
+    'MESSAGE_FLUSH_INTERVAL': config('CHATBOT_MESSAGE_FLUSH_INTERVAL', default=0.5, cast=float),
+}
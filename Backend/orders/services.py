@@ -0,0 +1,84 @@
+"""
+Order reads for the chatbot.
+
+``order_details`` answers from a per-user cache entry keyed by the order's
+``updated_at``: a repeat question costs one indexed version lookup, and
+only a changed (or uncached) order is loaded again, with its addresses
+joined and its items and products prefetched, then projected to a compact
+dict instead of the nested ``OrderSerializer`` output.
+"""
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .models import Order, OrderItem
+
+# Entries are replaced as soon as the order's updated_at moves; the TTL only bounds memory
+DETAILS_TTL = 60 * 60
+
+
+def format_address(address):
+    if address is None:
+        return None
+    lines = [address.full_name, address.address_line1, address.address_line2,
+             f"{address.city}, {address.state} {address.postal_code}", address.country]
+    return ", ".join(line for line in lines if line)
+
+
+def load_order(order_id):
+    order = (
+        Order.objects.select_related("shipping_address", "billing_address")
+        .prefetch_related(Prefetch("items", queryset=OrderItem.objects.select_related("product").order_by("id")))
+        .get(pk=order_id)
+    )
+    return {
+        "order_id": order.pk,
+        "order_number": order.order_number,
+        "status": order.status,
+        "payment_method": order.payment_method,
+        "tracking_number": order.tracking_number,
+        "created_at": order.created_at.isoformat(),
+        "shipped_at": order.shipped_at.isoformat() if order.shipped_at else None,
+        "delivered_at": order.delivered_at.isoformat() if order.delivered_at else None,
+        "shipping_address": format_address(order.shipping_address),
+        "billing_address": format_address(order.billing_address),
+        "items": [
+            {
+                "product_id": item.product_id,
+                "name": item.product.name,
+                "quantity": item.quantity,
+                "price": float(item.price),
+                "total": float(item.total),
+            }
+            for item in order.items.all()
+        ],
+        "subtotal": float(order.subtotal),
+        "shipping_cost": float(order.shipping_cost),
+        "tax": float(order.tax),
+        "discount": float(order.discount),
+        "total": float(order.total),
+    }
+
+
+def order_details(user_id, order_id=None, order_number=None):
+    """
+    Compact details of one of the user's orders, by id or order number, or their
+    latest order if neither is given. Raises Order.DoesNotExist if the user has
+    no such order.
+    """
+    orders = Order.objects.filter(user_id=user_id)
+    if order_id is not None:
+        orders = orders.filter(pk=order_id)
+    if order_number:
+        orders = orders.filter(order_number__iexact=order_number)
+    version = orders.order_by("-created_at").values_list("pk", "updated_at").first()
+    if version is None:
+        raise Order.DoesNotExist
+    pk, updated_at = version
+
+    key = f"orders:details:{user_id}:{pk}"
+    cached = cache.get(key)
+    if cached is not None and cached[0] == updated_at:
+        return cached[1]
+    details = load_order(pk)
+    cache.set(key, (updated_at, details), DETAILS_TTL)
+    return details
@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, pre_migrate
 
 
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        from . import search_index
+
+        pre_migrate.connect(search_index.drop_triggers, sender=self)
+        post_migrate.connect(search_index.restore_triggers, sender=self)
@@ -0,0 +1,145 @@
+from django.db import migrations
+
+# Full-text index over product name, description, sku and category name.
+# Triggers keep it in sync with every write path, including bulk_create()
+# and QuerySet.update(), which never send model signals.
+
+SQLITE_FORWARDS = [
+    """
+    CREATE VIRTUAL TABLE products_product_fts USING fts5(
+        name, description, sku, category, tokenize='porter unicode61'
+    )
+    """,
+    """
+    INSERT INTO products_product_fts (rowid, name, description, sku, category)
+    SELECT p.id, p.name, p.description, p.sku, c.name
+    FROM products_product p JOIN products_category c ON c.id = p.category_id
+    """,
+    """
+    CREATE TRIGGER products_product_fts_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO products_product_fts (rowid, name, description, sku, category)
+        VALUES (new.id, new.name, new.description, new.sku,
+                (SELECT name FROM products_category WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_update AFTER UPDATE OF name, description, sku, category_id ON products_product
+    WHEN old.name IS NOT new.name OR old.description IS NOT new.description
+        OR old.sku IS NOT new.sku OR old.category_id IS NOT new.category_id
+    BEGIN
+        DELETE FROM products_product_fts WHERE rowid = old.id;
+        INSERT INTO products_product_fts (rowid, name, description, sku, category)
+        VALUES (new.id, new.name, new.description, new.sku,
+                (SELECT name FROM products_category WHERE id = new.category_id));
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_delete AFTER DELETE ON products_product BEGIN
+        DELETE FROM products_product_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER products_category_fts_update AFTER UPDATE OF name ON products_category
+    WHEN old.name IS NOT new.name
+    BEGIN
+        UPDATE products_product_fts SET category = new.name
+        WHERE rowid IN (SELECT id FROM products_product WHERE category_id = new.id);
+    END
+    """,
+]
+
+SQLITE_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS products_category_fts_update",
+    "DROP TRIGGER IF EXISTS products_product_fts_delete",
+    "DROP TRIGGER IF EXISTS products_product_fts_update",
+    "DROP TRIGGER IF EXISTS products_product_fts_insert",
+    "DROP TABLE IF EXISTS products_product_fts",
+]
+
+POSTGRES_FORWARDS = [
+    """
+    CREATE FUNCTION products_product_document(name text, sku text, category text, description text)
+    RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+        SELECT setweight(to_tsvector('english', coalesce(name, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(sku, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(category, '')), 'B')
+            || setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    $$
+    """,
+    """
+    CREATE TABLE products_product_search (
+        product_id bigint PRIMARY KEY REFERENCES products_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    "CREATE INDEX products_product_search_document ON products_product_search USING GIN (document)",
+    """
+    INSERT INTO products_product_search (product_id, document)
+    SELECT p.id, products_product_document(p.name, p.sku, c.name, p.description)
+    FROM products_product p JOIN products_category c ON c.id = p.category_id
+    """,
+    """
+    CREATE FUNCTION products_product_search_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        INSERT INTO products_product_search (product_id, document)
+        SELECT NEW.id, products_product_document(NEW.name, NEW.sku, c.name, NEW.description)
+        FROM products_category c WHERE c.id = NEW.category_id
+        ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER products_product_search_refresh
+    AFTER INSERT OR UPDATE OF name, description, sku, category_id ON products_product
+    FOR EACH ROW EXECUTE FUNCTION products_product_search_refresh()
+    """,
+    """
+    CREATE FUNCTION products_category_search_refresh() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE products_product_search s
+        SET document = products_product_document(p.name, p.sku, NEW.name, p.description)
+        FROM products_product p
+        WHERE p.id = s.product_id AND p.category_id = NEW.id;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE TRIGGER products_category_search_refresh
+    AFTER UPDATE OF name ON products_category
+    FOR EACH ROW WHEN (OLD.name IS DISTINCT FROM NEW.name)
+    EXECUTE FUNCTION products_category_search_refresh()
+    """,
+]
+
+POSTGRES_BACKWARDS = [
+    "DROP TRIGGER IF EXISTS products_category_search_refresh ON products_category",
+    "DROP FUNCTION IF EXISTS products_category_search_refresh()",
+    "DROP TRIGGER IF EXISTS products_product_search_refresh ON products_product",
+    "DROP FUNCTION IF EXISTS products_product_search_refresh()",
+    "DROP TABLE IF EXISTS products_product_search",
+    "DROP FUNCTION IF EXISTS products_product_document(text, text, text, text)",
+]
+
+
+def run(statements_by_vendor):
+    def operation(apps, schema_editor):
+        # Other databases fall back to the LIKE search in products.search
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARDS, 'postgresql': POSTGRES_FORWARDS}),
+            run({'sqlite': SQLITE_BACKWARDS, 'postgresql': POSTGRES_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,97 @@
+"""
+Keyword search over the full-text product index.
+
+The index (migration 0002_product_search_index) is an FTS5 table on SQLite
+and a tsvector table with a GIN index on PostgreSQL, both kept in sync by
+triggers. ``search_products`` ranks matches with BM25 (``ts_rank_cd`` on
+PostgreSQL), applies the category and price filters in the same query and
+returns one page of compact rows. Other databases get a LIKE scan.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Product
+
+# Column weights for bm25(): name, description, sku, category
+BM25_WEIGHTS = (10.0, 1.0, 5.0, 3.0)
+
+_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+SQLITE_SEARCH = """
+    SELECT p.id, p.name, COALESCE(p.discount_price, p.price) AS current_price, p.image
+    FROM products_product_fts f
+    JOIN products_product p ON p.id = f.rowid
+    JOIN products_category c ON c.id = p.category_id
+    WHERE products_product_fts MATCH %s AND p.is_active {filters}
+    ORDER BY bm25(products_product_fts, {weights}), p.id
+    LIMIT %s OFFSET %s
+"""
+
+POSTGRES_SEARCH = """
+    SELECT p.id, p.name, COALESCE(p.discount_price, p.price) AS current_price, p.image
+    FROM products_product_search s
+    JOIN products_product p ON p.id = s.product_id
+    JOIN products_category c ON c.id = p.category_id,
+    websearch_to_tsquery('english', %s) q
+    WHERE s.document @@ q AND p.is_active {filters}
+    ORDER BY ts_rank_cd(s.document, q) DESC, p.id
+    LIMIT %s OFFSET %s
+"""
+
+
+def fts5_query(keyword):
+    """
+    Quote every term so user input cannot inject FTS5 syntax; all terms must
+    match, and the last one also matches as a prefix for search-as-you-type.
+    """
+    terms = _TERM_RE.findall(keyword)
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_products(keyword, category=None, price_limit=None, limit=10, offset=0):
+    """Rows of ``id``, ``name``, ``current_price`` and ``image`` for products matching ``keyword``, best first"""
+    filters, params = [], []
+    if category:
+        filters.append("AND c.name LIKE %s" if connection.vendor == "sqlite" else "AND c.name ILIKE %s")
+        params.append(f"%{category}%")
+    if price_limit is not None:
+        filters.append("AND COALESCE(p.discount_price, p.price) <= %s")
+        params.append(price_limit)
+
+    if connection.vendor == "sqlite":
+        query = fts5_query(keyword)
+        if query is None:
+            return []
+        sql = SQLITE_SEARCH.format(filters=" ".join(filters), weights=", ".join(map(str, BM25_WEIGHTS)))
+    elif connection.vendor == "postgresql":
+        query = keyword
+        sql = POSTGRES_SEARCH.format(filters=" ".join(filters))
+    else:
+        return like_search(keyword, category, price_limit, limit, offset)
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [query, *params, limit, offset])
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def like_search(keyword, category=None, price_limit=None, limit=10, offset=0):
+    """Unindexed fallback: substring match, name matches first"""
+    products = Product.objects.filter(is_active=True).annotate(current_price=Coalesce("discount_price", "price"))
+    if category:
+        products = products.filter(category__name__icontains=category)
+    if price_limit is not None:
+        products = products.filter(current_price__lte=price_limit)
+    products = products.filter(
+        Q(name__icontains=keyword) | Q(description__icontains=keyword) | Q(sku__iexact=keyword) | Q(category__name__icontains=keyword)
+    ).annotate(
+        rank=Case(When(name__icontains=keyword, then=Value(1)), default=Value(0), output_field=IntegerField())
+    )
+    return list(products.order_by("-rank", "id").values("id", "name", "current_price", "image")[offset:offset + limit])
@@ -0,0 +1,83 @@
+"""
+Keeps the SQLite full-text index triggers out of the way of schema changes.
+
+SQLite can't alter most columns in place, so Django rebuilds
+``products_product`` (create a copy, drop the original, rename the copy).
+Dropping the table also drops the triggers on it, and renaming the copy
+fails while ``products_category_fts_update`` still refers to the dropped
+table. So every ``migrate`` run drops the triggers first (``pre_migrate``)
+and recreates them afterwards (``post_migrate``), refilling the index when a
+products migration ran, since it may have written rows with no triggers in
+place. Migrations need nothing special; a failed ``migrate`` leaves the
+triggers dropped until the next successful one.
+"""
+from django.db import connections
+
+TRIGGERS = {
+    "products_product_fts_insert": """
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_insert AFTER INSERT ON products_product BEGIN
+            INSERT INTO products_product_fts (rowid, name, description, sku, category)
+            VALUES (new.id, new.name, new.description, new.sku,
+                    (SELECT name FROM products_category WHERE id = new.category_id));
+        END
+    """,
+    "products_product_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_update
+        AFTER UPDATE OF name, description, sku, category_id ON products_product
+        WHEN old.name IS NOT new.name OR old.description IS NOT new.description
+            OR old.sku IS NOT new.sku OR old.category_id IS NOT new.category_id
+        BEGIN
+            DELETE FROM products_product_fts WHERE rowid = old.id;
+            INSERT INTO products_product_fts (rowid, name, description, sku, category)
+            VALUES (new.id, new.name, new.description, new.sku,
+                    (SELECT name FROM products_category WHERE id = new.category_id));
+        END
+    """,
+    "products_product_fts_delete": """
+        CREATE TRIGGER IF NOT EXISTS products_product_fts_delete AFTER DELETE ON products_product BEGIN
+            DELETE FROM products_product_fts WHERE rowid = old.id;
+        END
+    """,
+    "products_category_fts_update": """
+        CREATE TRIGGER IF NOT EXISTS products_category_fts_update AFTER UPDATE OF name ON products_category
+        WHEN old.name IS NOT new.name
+        BEGIN
+            UPDATE products_product_fts SET category = new.name
+            WHERE rowid IN (SELECT id FROM products_product WHERE category_id = new.id);
+        END
+    """,
+}
+
+REINDEX = [
+    "DELETE FROM products_product_fts",
+    """
+    INSERT INTO products_product_fts (rowid, name, description, sku, category)
+    SELECT p.id, p.name, p.description, p.sku, c.name
+    FROM products_product p JOIN products_category c ON c.id = p.category_id
+    """,
+]
+
+
+def has_index(connection):
+    return "products_product_fts" in connection.introspection.table_names()
+
+
+def drop_triggers(sender, using, **kwargs):
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name in TRIGGERS:
+            cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def restore_triggers(sender, using, plan=None, **kwargs):
+    connection = connections[using]
+    if connection.vendor != "sqlite" or not has_index(connection):
+        return
+    with connection.cursor() as cursor:
+        if any(migration.app_label == "products" for migration, backwards in plan or []):
+            for statement in REINDEX:
+                cursor.execute(statement)
+        for statement in TRIGGERS.values():
+            cursor.execute(statement)
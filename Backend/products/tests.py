@@ -1,3 +1,50 @@
-from django.test import TestCase
+from unittest import skipUnless
 
-# Create your tests here.
+from django.core.management.sql import emit_post_migrate_signal, emit_pre_migrate_signal
+from django.db import connection, migrations, models
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TransactionTestCase
+
+from .models import Category, Product
+from .search import search_products
+
+
+@skipUnless(connection.vendor == 'sqlite', 'SQLite rebuilds the table to alter a column')
+class SearchIndexMigrationTests(TransactionTestCase):
+    """A later migration that rebuilds products_product must keep the full-text index working"""
+
+    def migrate(self, migration, backwards=False):
+        executor = MigrationExecutor(connection)
+        leaf = executor.loader.graph.leaf_nodes('products')[0]
+        state = executor.loader.project_state(leaf)
+        plan = [(migration, backwards)]
+        emit_pre_migrate_signal(0, False, connection.alias, apps=state.apps, plan=plan)
+        with connection.schema_editor(atomic=True) as schema_editor:
+            if backwards:
+                to_state = state.clone()
+                migration.mutate_state(to_state, preserve=False)
+                migration.unapply(to_state, schema_editor)
+            else:
+                migration.apply(state.clone(), schema_editor)
+        emit_post_migrate_signal(0, False, connection.alias, apps=state.apps, plan=plan)
+
+    def test_alter_product_field(self):
+        category = Category.objects.create(name='Phones', slug='phones')
+        Product.objects.create(name='Nova phone', slug='nova-phone', description='A phone', category=category,
+                               price=100, stock=1, sku='NOVA-1')
+        migration = migrations.Migration('9999_alter_product_name', 'products')
+        migration.operations = [
+            migrations.AlterField('product', 'name', models.CharField(max_length=300)),
+        ]
+
+        self.migrate(migration)
+        try:
+            Product.objects.create(name='Orbit phone', slug='orbit-phone', description='Another phone',
+                                   category=category, price=200, stock=1, sku='ORBIT-1')
+            category.name = 'Smartphones'
+            category.save()
+            self.assertEqual({row['name'] for row in search_products('phone')}, {'Nova phone', 'Orbit phone'})
+            self.assertEqual(len(search_products('phone', category='Smartphones')), 2)
+        finally:
+            self.migrate(migration, backwards=True)
+        self.assertEqual(len(search_products('orbit')), 1)